@@ -0,0 +1,287 @@
+import copy
+import os
+import sys
+import types
+
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("PIL")
+pytest.importorskip("onnx")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import trainermin  # noqa: E402
+
+
+@pytest.fixture
+def cpu(monkeypatch):
+    """Run on the CPU even where DirectML or another accelerator is present."""
+    monkeypatch.setattr(trainermin, "DEVICE", "cpu")
+
+
+def synthetic_capture(n, size=64, seed=0):
+    """Aligned frames as read_capture_file returns them, with random eye images and labels in [0, 1]."""
+    rng = np.random.RandomState(seed)
+
+    def frame(i):
+        label = tuple(float(v) for v in rng.uniform(0, 1, 16)) + (trainermin.FLAG_GOOD_DATA,)
+        left, right = (cv2.imencode(".jpg", rng.randint(0, 256, (size, size), dtype=np.uint8))[1].tobytes() for _ in range(2))
+        return (label, left, right, i, None)
+
+    frames = [frame(i) for i in range(n + 3)]
+    return [frames[i][:4] + (frames[i - 3:i],) for i in range(3, n + 3)]
+
+
+@pytest.fixture
+def capture(monkeypatch):
+    """Make CaptureDataset read a 40-frame synthetic capture instead of a file."""
+    monkeypatch.setattr(trainermin, "read_capture_file", lambda *args, **kwargs: synthetic_capture(40))
+
+
+def random_batches(count, batch_size=4, channels=4, seed=0):
+    """(inputs, labels, states) batches shaped like a single-eye CaptureDataset's."""
+    generator = torch.Generator().manual_seed(seed)
+    return [(torch.rand(batch_size, channels, 64, 64, generator=generator), torch.rand(batch_size, 3, generator=generator),
+             torch.ones(batch_size, dtype=torch.bool)) for _ in range(count)]
+
+
+def test_bf16_training_autocasts_forward_only(cpu, monkeypatch):
+    torch.manual_seed(0)
+    model = trainermin.MicroChad()
+    conv_dtypes, loss_dtypes, grads_finite = [], [], []
+    model.conv1.register_forward_hook(lambda module, inputs, output: conv_dtypes.append(output.dtype))
+    for p in model.parameters():
+        p.register_hook(lambda grad: grads_finite.append(bool(torch.isfinite(grad).all())))
+
+    calibration_loss = trainermin.calibration_loss
+
+    def recording_loss(*args):
+        loss = calibration_loss(*args)
+        loss_dtypes.append(loss.dtype)
+        return loss
+    monkeypatch.setattr(trainermin, "calibration_loss", recording_loss)
+
+    trainermin.train_model(model, None, random_batches(3), num_epochs=1, lr=1e-3, class_step=True, precision="bf16")
+
+    # The forward pass ran under bf16 autocast; the loss, gradients and weights stay fp32
+    assert conv_dtypes and set(conv_dtypes) == {torch.bfloat16}
+    assert loss_dtypes and set(loss_dtypes) == {torch.float32}
+    assert grads_finite and all(grads_finite)
+    assert all(p.dtype == torch.float32 and torch.isfinite(p).all() for p in model.parameters())
+
+
+def baseline_augmentation(image):
+    """The augmentation sequence CaptureDataset.__getitem__ has always applied, drawing as it goes."""
+    if np.random.random() < 0.2:
+        image = trainermin.apply_spatial_transformations(image, max_shift=24, max_rotation=10, max_scale=0.1)
+    if np.random.random() < 0.3:
+        image = trainermin.apply_intensity_transformations(image, brightness_range=0.1, contrast_range=0.6)
+    if np.random.random() < 0.2:
+        image = trainermin.apply_blur(image, max_kernel_size=5)
+    return image
+
+
+def test_augmentation_plan_keeps_seeded_draws(capture):
+    single = trainermin.CaptureDataset("synthetic.bin", all_frames=False, side="left")
+    joint = trainermin.CaptureDataset("synthetic.bin", all_frames=False, side="both")
+    augmented = 0
+    for seed in range(40):
+        image = single.load_image(seed)
+        np.random.seed(seed)
+        expected = baseline_augmentation(image)
+        np.random.seed(seed)
+        plan = single.draw_augmentation()
+        assert torch.equal(single.apply_augmentation(image, plan), expected)
+        augmented += single.augments(plan)
+
+        # Joint mode draws the left eye's plan first, then an independent one for the right eye
+        np.random.seed(seed)
+        plans = joint.draw_augmentation()
+        assert len(plans) == 2 and plans[0] == plan[0]
+        assert torch.equal(joint.apply_augmentation(joint.load_image(seed), plans)[0::2], expected)
+    assert augmented > 0
+
+
+def test_prefetch_loader_augmentation_is_reproducible(capture, cpu):
+    dataset = trainermin.CaptureDataset("synthetic.bin", all_frames=False, side="both")
+    dataset.augment = True
+
+    def epoch(workers):
+        sampler = trainermin.EpochSampler(len(dataset))
+        sampler.set_epoch(1)
+        loader = trainermin.PrefetchLoader(dataset, batch_size=8, sampler=sampler, num_workers=workers, seed=3)
+        return torch.cat([inputs for inputs, _, _ in loader])
+
+    # Thread scheduling differs between the two, the augmentation must not
+    torch.manual_seed(0)
+    first = epoch(1)
+    torch.manual_seed(0)
+    assert torch.equal(first, epoch(4))
+    torch.manual_seed(0)
+    assert torch.equal(first, epoch(1))
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_temporal_runs_match_per_sample_augmentation(capture, cpu, seed):
+    dataset = trainermin.CaptureDataset("synthetic.bin", all_frames=False, side="both")
+    dataset.augment = True
+    runs = trainermin.TemporalRunDataset(dataset, 4)
+
+    np.random.seed(seed)
+    inputs, _, _ = runs[2]
+    # The run shares one draw; every sample must look as if the plain dataset had augmented it with that draw
+    np.random.seed(seed)
+    plan = dataset.draw_augmentation()
+    expected = torch.stack([dataset.apply_augmentation(dataset.load_image(idx), plan) for idx in runs.runs[2]])
+    assert torch.allclose(inputs, expected, atol=1e-6)
+
+
+@pytest.mark.parametrize("extra", [["--hard-examples"], ["--checkpoint-every", "5"]])
+def test_temporal_runs_reject_per_sample_options(extra):
+    with pytest.raises(SystemExit):
+        trainermin.parse_args(["capture.bin", "out.onnx", "--temporal-runs", "4"] + extra)
+    assert trainermin.parse_args(["capture.bin", "out.onnx", "--temporal-runs", "4"]).checkpoint_every == 0
+
+
+@pytest.mark.parametrize("spec", ["cv2=0", "torch=0", "interop=0", "workers=0", "torch=-1", "gpu=2"])
+def test_thread_budget_rejects_invalid_shares(spec):
+    with pytest.raises(ValueError):
+        trainermin.ThreadBudget.from_spec(spec, cores=8)
+
+
+def test_thread_budget_gives_torch_every_core_without_threaded_loader():
+    threaded = trainermin.ThreadBudget.from_spec("cv2=2", cores=8)
+    assert (threaded.torch_threads, threaded.loader_workers, threaded.cv2_threads) == (6, 2, 2)
+    inline = trainermin.ThreadBudget.from_spec("", cores=8, threaded_loader=False)
+    assert (inline.torch_threads, inline.loader_workers) == (8, 0)
+    with pytest.raises(ValueError):
+        trainermin.ThreadBudget.from_spec("workers=2", cores=8, threaded_loader=False)
+    with pytest.raises(SystemExit):
+        trainermin.parse_args(["capture.bin", "out.onnx", "--loader", "torch", "--autotune-threads"])
+    assert trainermin.parse_args(["capture.bin", "out.onnx", "--loader", "threaded", "--loader-workers", "2"]).loader_workers == 2
+
+
+def random_multi(seed=0, **kwargs):
+    torch.manual_seed(seed)
+    return trainermin.MultiChad(**kwargs).eval()
+
+
+def test_streaming_engine_matches_stacked_model():
+    multi = random_multi()
+    engine = trainermin.StreamingMultiChad(copy.deepcopy(multi))
+    rng = np.random.RandomState(0)
+    eyes = [tuple(rng.rand(64, 64).astype(np.float32) for _ in range(2)) for _ in range(7)]
+    for t, (left, right) in enumerate(eyes):
+        streamed = engine.push_frame(left, right)
+        if t < 3:
+            assert streamed is None
+            continue
+        # Current frame, then its three previous frames oldest first, left and right interleaved
+        window = [eyes[t]] + eyes[t - 3:t]
+        x = torch.from_numpy(np.stack([eye for pair in window for eye in pair]))[None]
+        with torch.no_grad():
+            expected = multi(x)[0].numpy()
+        assert np.allclose(streamed, expected, atol=1e-5)
+    engine.reset()
+    assert engine.push_frame(*eyes[0]) is None
+
+
+def test_activation_cache_keeps_model_dtype():
+    cache = trainermin.ActivationCache(max_mb=1)
+    activation = torch.rand(8, 32, 32)
+    cache.add(3, activation)
+    assert cache[3].dtype == torch.float32 and torch.equal(cache[3], activation)
+    assert cache.bytes == activation.numel() * 4
+
+
+@pytest.mark.parametrize("sweep", ["0,6", "-1", "1,a", ","])
+def test_sweep_freeze_rejects_invalid_block_counts(sweep):
+    with pytest.raises(SystemExit):
+        trainermin.parse_args(["capture.bin", "out.onnx", "--sweep-freeze", sweep])
+    assert trainermin.parse_args(["capture.bin", "out.onnx", "--sweep-freeze", "0, 2,5"]).sweep_freeze == [0, 2, 5]
+
+
+@pytest.mark.parametrize("fraction", [0.25, 0.5])
+def test_select_coreset_keeps_requested_fraction(capture, fraction):
+    dataset = trainermin.CaptureDataset("synthetic.bin", all_frames=False, side="left")
+    args = types.SimpleNamespace(coreset=fraction, coreset_embedding="pixels", coreset_label_weight=1.0, loader_workers=1)
+    view, indices = trainermin.select_coreset(dataset, args)
+    assert len(indices) == round(40 * fraction)
+    assert list(indices) == sorted(set(indices))
+    assert len(view) == len(indices)
+    assert [frame[3] for frame in view.aligned_frames] == [dataset.aligned_frames[i][3] for i in indices]
+
+
+def test_k_center_greedy_never_repeats_duplicate_frames():
+    points = np.zeros((10, 4), dtype=np.float32)
+    points[7] = 1
+    # Only two distinct points, so selection stops after two picks instead of repeating one
+    selected = trainermin.k_center_greedy(points, 5)
+    assert len(selected) == 2 and 7 in selected
+
+    distinct = np.random.RandomState(0).rand(50, 3).astype(np.float32)
+    assert trainermin.k_center_greedy(distinct, 20, chunk_size=7) == trainermin.k_center_greedy(distinct, 20)
+    assert trainermin.k_center_greedy(distinct, 50) == list(range(50))
+
+
+def test_epoch_sampler_shards_cover_every_sample():
+    def shards(epoch):
+        samplers = [trainermin.EpochSampler(10, rank=rank, world_size=3, seed=7) for rank in range(3)]
+        for sampler in samplers:
+            sampler.set_epoch(epoch)
+        return [list(sampler) for sampler in samplers]
+
+    first = shards(2)
+    assert [len(shard) for shard in first] == [4, 4, 4]
+    assert set().union(*first) == set(range(10))
+    # 12 slots for 10 samples, the first two of the order are repeated
+    assert sum(len(shard) for shard in first) - 10 == 2
+    assert shards(2) == first
+    assert shards(3) != first
+
+
+def test_distributed_needs_torchrun_and_uniform_sampling(monkeypatch):
+    with pytest.raises(SystemExit):
+        trainermin.parse_args(["capture.bin", "out.onnx", "--distributed", "--hard-examples"])
+    monkeypatch.delenv("WORLD_SIZE", raising=False)
+    monkeypatch.delenv("RANK", raising=False)
+    with pytest.raises(RuntimeError, match="torchrun"):
+        trainermin.init_distributed(trainermin.parse_args(["capture.bin", "out.onnx", "--distributed"]))
+    assert trainermin.init_distributed(trainermin.parse_args(["capture.bin", "out.onnx"])) == (0, 1)
+
+
+def test_merged_adapters_match_adapted_model():
+    multi = random_multi()
+    trainermin.add_adapters(multi, rank=4)
+    torch.manual_seed(1)
+    with torch.no_grad():
+        for p in multi.parameters():
+            if p.requires_grad:
+                p.add_(torch.randn_like(p) * 0.05)
+    x = torch.rand(2, 8, 64, 64)
+    with torch.no_grad():
+        adapted = multi(x)
+        merged = trainermin.merge_adapters(multi)(x)
+    assert torch.allclose(adapted, merged, atol=1e-5)
+    assert not any(isinstance(m, (trainermin.AdaptedConv2d, trainermin.AdaptedLinear)) for m in multi.modules())
+
+
+def test_checkpoint_writer_round_trip(tmp_path):
+    path = str(tmp_path / "checkpoint.pth")
+    state = {'epoch': 3, 'order': [4, 1, 2, 0, 3], 'model': {'weight': torch.rand(4, 4)}}
+    writer = trainermin.CheckpointWriter(path, joint=True)
+    writer.save({'eye': 'both', 'stage': 'aug'}, state)
+    writer.close()
+    assert writer.writes == 1
+
+    checkpoint = trainermin.CheckpointWriter.load(path)
+    assert checkpoint['context'] == {'joint': True, 'completed': {}}
+    assert checkpoint['phase'] == {'eye': 'both', 'stage': 'aug'}
+    assert checkpoint['state']['epoch'] == 3 and checkpoint['state']['order'] == state['order']
+    assert torch.equal(checkpoint['state']['model']['weight'], state['model']['weight'])
+
+    trainermin.CheckpointWriter(path).close(remove=True)
+    assert not os.path.exists(path)
+    assert trainermin.CheckpointWriter.load(path) is None
@@ -1,19 +1,53 @@
 import torch
-import torch_directml
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import Dataset, DataLoader, Subset, Sampler
+from torch.utils.data.dataloader import default_collate
 from torch.optim.lr_scheduler import LambdaLR, CosineAnnealingLR
+from torch.ao.quantization import FakeQuantize, MovingAverageMinMaxObserver, MovingAveragePerChannelMinMaxObserver, disable_observer
 import numpy as np
 import struct
 import cv2
 import time
 import sys
+import os
 import bisect
+import argparse
+import contextlib
+import copy
+import inspect
+import random
+import threading
+import queue
+import json
+import subprocess
+import tempfile
+import platform
 import onnx
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageFile
 
+try:
+    import torch_directml
+except ImportError:
+    torch_directml = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import onnxruntime as ort
+    from onnxruntime import quantization as ort_quant
+except ImportError:
+    ort = None
+    ort_quant = None
+
 # Constants
 FLOAT_TO_INT_CONSTANT = 1
 
@@ -22,28 +56,48 @@ FLAG_GOOD_DATA = 1 << 30  # 1073741824
 
 TRAINING = True
 
+# Side of the square eye images in the capture, and the resolution the model is
+# trained and exported at (--resolution; MicroChad's adaptive pool accepts any size)
+INPUT_SIZE = 128
+RESOLUTION = INPUT_SIZE
+
 # Optimized alignment parameters
 WIN_SIZE_MUL = 10  # Window size multiplier for perfect accuracy
 
+# Calibration schedule: augmented epochs followed by clean epochs, per eye
+EPOCHS_AUG = 8 # 8
+EPOCHS_NOAUG = 1
+
+# Batch size the 0.001 learning rate was tuned for; other batch sizes scale the LR from here
+BASE_BATCH_SIZE = 32
+BASE_LR = 0.001
+
 DEVICE = "mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu"
 
 DEVICE = "cpu"
 
-if DEVICE != "mps" and DEVICE != "cuda":
+# Without DirectML (any non-Windows machine) training stays on the CPU
+if DEVICE != "mps" and DEVICE != "cuda" and torch_directml is not None:
     try:
         DEVICE = torch_directml.device(0)
     except: DEVICE = "cpu"
 
+# Output channels of the full-size MicroChad's conv blocks
+MICROCHAD_CHANNELS = (28, 42, 63, 94, 141, 212)
+
 class MicroChad(nn.Module):
-    def __init__(self):
+    def __init__(self, width_mult=1.0, depth=len(MICROCHAD_CHANNELS), channels=None):
         super(MicroChad, self).__init__()
-        self.conv1 = nn.Conv2d(4, 28, kernel_size=3, stride=1, padding=1)
-        self.conv2 = nn.Conv2d(28, 42, kernel_size=3, stride=1, padding=1)
-        self.conv3 = nn.Conv2d(42, 63, kernel_size=3, stride=1, padding=1)
-        self.conv4 = nn.Conv2d(63, 94, kernel_size=3, stride=1, padding=1)
-        self.conv5 = nn.Conv2d(94, 141, kernel_size=3, stride=1, padding=1)
-        self.conv6 = nn.Conv2d(141, 212, kernel_size=3, stride=1, padding=1)
-        self.fc = nn.Linear(212, 3)
+        if channels is None:
+            if not 1 <= depth <= len(MICROCHAD_CHANNELS):
+                raise ValueError(f"MicroChad depth must be between 1 and {len(MICROCHAD_CHANNELS)}, got {depth}")
+            channels = [max(4, int(round(c * width_mult))) for c in MICROCHAD_CHANNELS[:depth]]
+        self.depth = len(channels)
+
+        # conv1..conv<depth>, named as in the full-size model so its state dicts and helpers keep working
+        for i, (c_in, c_out) in enumerate(zip([4] + channels[:-1], channels)):
+            setattr(self, "conv%d" % (i + 1), nn.Conv2d(c_in, c_out, kernel_size=3, stride=1, padding=1))
+        self.fc = nn.Linear(channels[-1], 3)
 
         self.pool = nn.MaxPool2d(kernel_size=2, stride=2, padding=0, dilation=1, ceil_mode=False)
         self.adaptive = nn.AdaptiveMaxPool2d(output_size=1)
@@ -51,29 +105,18 @@ class MicroChad(nn.Module):
         self.act = nn.ReLU(inplace=True)
         self.sigmoid = nn.Sigmoid()
 
-    def forward(self, x, return_blends=True):
-        x = self.conv1(x)
-        x = self.act(x)
-        x = self.pool(x)
-
-        x = self.conv2(x)
-        x = self.act(x)
-        x = self.pool(x)
-
-        x = self.conv3(x)
-        x = self.act(x)
-        x = self.pool(x)
-
-        x = self.conv4(x)
-        x = self.act(x)
-        x = self.pool(x)
-
-        x = self.conv5(x)
-        x = self.act(x)
-        x = self.pool(x)
+    def forward_blocks(self, x, start=0, end=None):
+        """Run conv blocks [start, end); every block but the last ends in a 2x2 max pool."""
+        for i in range(start, self.depth if end is None else end):
+            x = getattr(self, "conv%d" % (i + 1))(x)
+            x = self.act(x)
+            if i < self.depth - 1:
+                x = self.pool(x)
+        return x
 
-        x = self.conv6(x)
-        x = self.act(x)
+    def forward(self, x, return_blends=True, start_block=0):
+        # start_block > 0 means x already holds the output of the first start_block blocks
+        x = self.forward_blocks(x, start_block)
 
         x = self.adaptive(x)
         x = torch.flatten(x, 1)
@@ -87,11 +130,11 @@ class MicroChad(nn.Module):
 
 
 class MultiChad(nn.Module):
-    def __init__(self):
+    def __init__(self, width_mult=1.0, depth=len(MICROCHAD_CHANNELS), channels=None):
         super(MultiChad, self).__init__()
 
-        self.left = MicroChad()
-        self.right = MicroChad()
+        self.left = MicroChad(width_mult, depth, channels)
+        self.right = MicroChad(width_mult, depth, channels)
     
     def forward(self, x, return_blends=True):
         inputs_left = x[:, [0, 2, 4, 6], :, :]
@@ -103,6 +146,152 @@ class MultiChad(nn.Module):
         return torch.cat([preds_left, preds_right], dim=-1)
 
 
+class FusedMultiChad(nn.Module):
+    """
+    Both towers of a MultiChad merged into a single network for export.
+
+    conv2 onwards are grouped convolutions with one group per tower and fc is
+    block-diagonal, giving one conv chain instead of two. The output matches
+    MultiChad's.
+
+    first_layer picks how the interleaved 8-channel input reaches the towers:
+    "gather" reorders it once and runs conv1 grouped as well; "dense" reads it
+    directly with each tower's conv1 weights placed on its own input channels and
+    zeros on the other tower's, which removes the gather but doubles conv1's
+    multiply-adds.
+    """
+    def __init__(self, multi, first_layer="gather"):
+        super(FusedMultiChad, self).__init__()
+        left, right = multi.left, multi.right
+        self.depth = left.depth
+        self.gather = first_layer == "gather"
+
+        with torch.no_grad():
+            l, r = left.conv1, right.conv1
+            self.conv1 = nn.Conv2d(2 * l.in_channels, l.out_channels + r.out_channels,
+                                   kernel_size=l.kernel_size, stride=l.stride, padding=l.padding,
+                                   groups=2 if self.gather else 1)
+            if self.gather:
+                self.conv1.weight.copy_(torch.cat([l.weight, r.weight]))
+            else:
+                self.conv1.weight.zero_()
+                self.conv1.weight[:l.out_channels, 0::2] = l.weight
+                self.conv1.weight[l.out_channels:, 1::2] = r.weight
+            self.conv1.bias.copy_(torch.cat([l.bias, r.bias]))
+
+            for i in range(2, self.depth + 1):
+                l, r = getattr(left, "conv%d" % i), getattr(right, "conv%d" % i)
+                conv = nn.Conv2d(l.in_channels + r.in_channels, l.out_channels + r.out_channels,
+                                 kernel_size=l.kernel_size, stride=l.stride, padding=l.padding, groups=2)
+                conv.weight.copy_(torch.cat([l.weight, r.weight]))
+                conv.bias.copy_(torch.cat([l.bias, r.bias]))
+                setattr(self, "conv%d" % i, conv)
+
+            l, r = left.fc, right.fc
+            self.fc = nn.Linear(l.in_features + r.in_features, l.out_features + r.out_features)
+            self.fc.weight.zero_()
+            self.fc.weight[:l.out_features, :l.in_features] = l.weight
+            self.fc.weight[l.out_features:, l.in_features:] = r.weight
+            self.fc.bias.copy_(torch.cat([l.bias, r.bias]))
+
+        self.pool = nn.MaxPool2d(kernel_size=2, stride=2, padding=0, dilation=1, ceil_mode=False)
+        self.adaptive = nn.AdaptiveMaxPool2d(output_size=1)
+        self.act = nn.ReLU(inplace=True)
+        self.sigmoid = nn.Sigmoid()
+
+    def forward(self, x):
+        if self.gather:
+            x = x[:, [0, 2, 4, 6, 1, 3, 5, 7], :, :]
+        for i in range(self.depth):
+            x = self.act(getattr(self, "conv%d" % (i + 1))(x))
+            if i < self.depth - 1:
+                x = self.pool(x)
+        x = torch.flatten(self.adaptive(x), 1)
+        return self.sigmoid(self.fc(x))
+
+
+# conv1 input channel of a tower holding the frame that is 0, 1, 2 and 3 frames
+# old: the capture stacks the current frame, then its previous frames oldest first
+FRAME_SLOTS = (0, 3, 2, 1)
+
+class StreamingMultiChad:
+    """
+    Real-time reference engine for a trained MultiChad, fed one frame at a time.
+
+    conv1 is linear before its ReLU, so its output is a sum of one contribution
+    per input frame. Each new eye image goes through conv1 once, for all four
+    positions it will take in the temporal window, as a single-channel
+    convolution with four blocks of filters. The contributions for the next three
+    frames are added into a ring of partial sums and picked up when those frames
+    arrive. The other layers run as usual.
+
+    This computes the same conv1 multiply-adds as the 8-channel model, split
+    across frames, so it saves no arithmetic; it only skips assembling the
+    8-channel input. A caller that keeps its last four preprocessed frames
+    decodes each frame once with either model. In exchange it reads and writes
+    partial sums four times the size of conv1's output every frame, which on a
+    CPU can cost more than the small 4-channel conv1 it replaces;
+    --benchmark-streaming measures both on the same frames. Training never sees a sample without its three previous
+    frames, so push_frame() returns None until the window is full.
+    """
+    def __init__(self, multi):
+        multi = multi.to("cpu").eval()
+        self.towers = [multi.left, multi.right]
+        with torch.no_grad():
+            # Per eye, one block of conv1 filters per frame age
+            self.weights = [torch.cat([tower.conv1.weight[:, [slot]] for slot in FRAME_SLOTS]).contiguous()
+                            for tower in self.towers]
+            self.biases = [tower.conv1.bias.view(-1, 1, 1).clone() for tower in self.towers]
+        self.pending = None
+        self.head = 0
+        self.frames = 0
+
+    def reset(self):
+        """Forget the previous frames, e.g. after the camera stream restarts."""
+        self.pending = None
+        self.head = 0
+        self.frames = 0
+
+    def push_frame(self, left, right):
+        """
+        Run the model for a new pair of preprocessed eye images (float32 arrays in
+        [0, 1], as CaptureDataset.preprocess_eye returns them).
+
+        Returns:
+            np.ndarray: [pitch, yaw, lid] of the left eye followed by the right eye,
+            or None for the first three frames after construction or reset()
+        """
+        self.frames += 1
+        warming_up = self.frames < len(FRAME_SLOTS)
+        outputs = []
+        with torch.no_grad():
+            for i, (tower, eye) in enumerate(zip(self.towers, (left, right))):
+                conv = tower.conv1
+                parts = F.conv2d(torch.from_numpy(eye)[None, None], self.weights[i], None, conv.stride, conv.padding)
+                parts = parts.view(len(FRAME_SLOTS), conv.out_channels, parts.shape[-2], parts.shape[-1])
+                if self.pending is None:
+                    self.pending = [torch.zeros((len(FRAME_SLOTS) - 1,) + parts.shape[1:]) for _ in self.towers]
+                ring = self.pending[i]
+
+                # ring[head] holds what the three earlier frames add to this one; once
+                # read it is reused for the frame three steps ahead
+                x = parts[0].add_(ring[self.head])
+                for age in range(1, len(FRAME_SLOTS) - 1):
+                    ring[(self.head + age) % len(ring)].add_(parts[age])
+                ring[self.head].copy_(parts[-1])
+                if warming_up:
+                    continue
+
+                x = x.add_(self.biases[i]).relu_().unsqueeze(0)
+                if tower.depth > 1:
+                    x = tower.pool(x)
+                outputs.append(tower(x, start_block=1))
+            self.head = (self.head + 1) % len(self.pending[0])
+        if warming_up:
+            return None
+        return torch.cat(outputs, dim=-1)[0].numpy()
+
+
 def calculate_row_pattern_consistency(image):
     """
     Calculate row pattern consistency metric for corruption detection.
@@ -357,8 +546,24 @@ def find_global_time_offset(label_timestamps, eye_timestamps, sample_size=100):
     
     return best_offset
 
-def apply_spatial_transformations(image, max_shift=10, max_rotation=5, max_scale=0.1):
-    """Apply spatial transformations to simulate headset movement."""
+# Per-thread override of the random source augmentation is drawn from (see PrefetchLoader)
+_augmentation_rng = threading.local()
+
+def augmentation_rng():
+    """The generator the current loader thread set for its sample, or NumPy's global random state."""
+    rng = getattr(_augmentation_rng, "rng", None)
+    return rng if rng is not None else np.random
+
+def draw_spatial_params(rng, max_shift=10, max_rotation=5, max_scale=0.1):
+    """Random (shift_x, shift_y, angle, scale) for apply_spatial_transformations()."""
+    shift_x = rng.randint(-max_shift, max_shift+1)
+    shift_y = rng.randint(-max_shift, max_shift+1)
+    angle = rng.uniform(-max_rotation, max_rotation)
+    scale = 1.0 + rng.uniform(-max_scale, max_scale)
+    return shift_x, shift_y, angle, scale
+
+def apply_spatial_transformations(image, max_shift=10, max_rotation=5, max_scale=0.1, params=None):
+    """Apply spatial transformations to simulate headset movement; params from draw_spatial_params() fixes them."""
     # Convert to tensor if needed
     if not isinstance(image, torch.Tensor):
         image = torch.from_numpy(image).float()
@@ -380,10 +585,7 @@ def apply_spatial_transformations(image, max_shift=10, max_rotation=5, max_scale
     # Apply transformation to each image in batch
     for b in range(batch_size):
         # Generate random transformation parameters
-        shift_x = np.random.randint(-max_shift, max_shift+1)
-        shift_y = np.random.randint(-max_shift, max_shift+1)
-        angle = np.random.uniform(-max_rotation, max_rotation)
-        scale = 1.0 + np.random.uniform(-max_scale, max_scale)
+        shift_x, shift_y, angle, scale = params or draw_spatial_params(np.random, max_shift, max_rotation, max_scale)
         
         # Create transformation matrix
         M = cv2.getRotationMatrix2D((width/2, height/2), angle, scale)
@@ -401,8 +603,17 @@ def apply_spatial_transformations(image, max_shift=10, max_rotation=5, max_scale
         return transformed.squeeze(0)
     return transformed
 
-def apply_intensity_transformations(image, brightness_range=0.2, contrast_range=0.2):
-    """Apply brightness and contrast variations to simulate lighting changes."""
+def draw_intensity_params(rng, brightness_range=0.2, contrast_range=0.2):
+    """Random (brightness, contrast) for apply_intensity_transformations()."""
+    # Brightness should be a small offset, not added to 1.0
+    brightness = rng.uniform(-brightness_range, brightness_range)
+
+    # Contrast is still a scaling factor centered around 1.0
+    contrast = 1.0 + rng.uniform(-contrast_range, contrast_range)
+    return brightness, contrast
+
+def apply_intensity_transformations(image, brightness_range=0.2, contrast_range=0.2, params=None):
+    """Apply brightness and contrast variations to simulate lighting changes; params from draw_intensity_params() fixes them."""
     # Convert to tensor if needed
     if not isinstance(image, torch.Tensor):
         image = torch.from_numpy(image).float()
@@ -419,11 +630,7 @@ def apply_intensity_transformations(image, brightness_range=0.2, contrast_range=
     transformed = []
     
     for b in range(batch_size):
-        # Brightness should be a small offset, not added to 1.0
-        brightness = np.random.uniform(-brightness_range, brightness_range)
-        
-        # Contrast is still a scaling factor centered around 1.0
-        contrast = 1.0 + np.random.uniform(-contrast_range, contrast_range)
+        brightness, contrast = params or draw_intensity_params(np.random, brightness_range, contrast_range)
         
         # Apply transformations: new_pixel = pixel * contrast + brightness
         img_transformed = image[b] * contrast + brightness
@@ -437,8 +644,18 @@ def apply_intensity_transformations(image, brightness_range=0.2, contrast_range=
         return transformed.squeeze(0)
     return transformed
 
-def apply_blur(image, max_kernel_size=5):
-    """Apply random Gaussian blur to simulate focus changes."""
+def draw_blur_params(rng, max_kernel_size=5):
+    """Random (kernel_size, sigma) for apply_blur(), or None when the sample stays sharp."""
+    # Apply blur with 50% probability
+    if rng.random() < 0.5:
+        # Generate random kernel size (must be odd)
+        kernel_size = 2 * rng.randint(1, max_kernel_size//2 + 1) + 1
+        sigma = rng.uniform(0.1, 2.0)
+        return kernel_size, sigma
+    return None
+
+def apply_blur(image, max_kernel_size=5, params=None):
+    """Apply random Gaussian blur to simulate focus changes; params from draw_blur_params() fixes it."""
     # Convert to tensor if needed
     if not isinstance(image, torch.Tensor):
         image = torch.from_numpy(image).float()
@@ -457,11 +674,9 @@ def apply_blur(image, max_kernel_size=5):
     # Create output tensor
     transformed = torch.zeros_like(image)
     
-    # Apply blur with 50% probability
-    if np.random.random() < 0.5:
-        # Generate random kernel size (must be odd)
-        kernel_size = 2 * np.random.randint(1, max_kernel_size//2 + 1) + 1
-        sigma = np.random.uniform(0.1, 2.0)
+    blur = params or draw_blur_params(np.random, max_kernel_size)
+    if blur is not None:
+        kernel_size, sigma = blur
         
         for b in range(batch_size):
             for c in range(channels):
@@ -849,6 +1064,12 @@ class CaptureDataset(Dataset):
 
         self.side = side
 
+        # None follows the global TRAINING switch; True/False pins augmentation for this
+        # dataset object (e.g. a validation view that must never be augmented)
+        self.augment = None
+        # Side the eye images are resized to; None follows the global RESOLUTION
+        self.resolution = None
+
         if force_zero:
             for e in range(len(self.aligned_frames)):
                 label_data, left_eye_jpeg, right_eye_jpeg, label_timestamp, previous_data = self.aligned_frames[e]
@@ -941,76 +1162,62 @@ class CaptureDataset(Dataset):
         return len(self.aligned_frames)
     
     def __getitem__(self, idx):
-        # Extract data from the aligned frame
-        label_data, left_eye_jpeg, right_eye_jpeg, label_timestamp, previous_data = self.aligned_frames[idx]
+        # Decide on augmentations first so cached/clean paths can skip work they don't need
+        plan = None
+        if TRAINING if self.augment is None else self.augment:
+            plan = self.draw_augmentation()
+
+        image = self.load_image(idx)
+        image = self.apply_augmentation(image, plan)
+
+        label, is_safe_frame = self.load_label(idx)
         
-        # Decode JPEG data for current frame
-        left_eye = decode_jpeg(left_eye_jpeg)
-    
-        right_eye = decode_jpeg(right_eye_jpeg)
+        # Apply any additional transforms if provided
+        if self.transform:
+            image = self.transform(image)
+        
+        return image.to(DEVICE), torch.from_numpy(label).to(DEVICE), is_safe_frame
+
+    def preprocess_eye(self, jpeg):
+        """Decode one eye image to an equalized grayscale float32 array in [0, 1]."""
+        eye = decode_jpeg(jpeg)
         # Convert to grayscale if needed
-        if len(left_eye.shape) == 3:
-            left_eye = cv2.cvtColor(left_eye, cv2.COLOR_BGR2GRAY)
-        if len(right_eye.shape) == 3:
-            right_eye = cv2.cvtColor(right_eye, cv2.COLOR_BGR2GRAY)
-        left_eye = cv2.equalizeHist(left_eye)
-        right_eye = cv2.equalizeHist(right_eye)
+        if len(eye.shape) == 3:
+            eye = cv2.cvtColor(eye, cv2.COLOR_BGR2GRAY)
+        eye = cv2.equalizeHist(eye)
+        size = self.resolution or RESOLUTION
+        if eye.shape[0] != size or eye.shape[1] != size:
+            eye = cv2.resize(eye, (size, size), interpolation=cv2.INTER_AREA)
 
         # Normalize images to [0, 1]
-        left_eye = left_eye.astype(np.float32)
-        right_eye = right_eye.astype(np.float32)
+        eye = eye.astype(np.float32)
+        eye /= 255.
+        return eye
 
-        left_eye /= 255.
-        right_eye /= 255.
-        
-        #left_eye -= np.amin(left_eye)
-        #right_eye -= np.amin(right_eye)
-        
-        #if np.amax(left_eye) > 0:
-        #    left_eye /= np.amax(left_eye)
-        #if np.amax(right_eye) > 0:
-        #    right_eye /= np.amax(right_eye)
-        
-        # Stack both eyes as channels for current frame
+    def stack_eyes(self, left_jpeg, right_jpeg):
+        """Channels for one time step; only the eyes this dataset uses are decoded."""
         if self.side == 'left':
-            current_frame = np.stack([left_eye,], axis=0)
+            return np.stack([self.preprocess_eye(left_jpeg),], axis=0)
+        elif self.side == 'both':
+            # Interleaved left/right so the 8-channel input matches MultiChad's channel split
+            return np.stack([self.preprocess_eye(left_jpeg), self.preprocess_eye(right_jpeg)], axis=0)
         else:
-            current_frame = np.stack([right_eye,], axis=0)
+            return np.stack([self.preprocess_eye(right_jpeg),], axis=0)
+
+    def load_image(self, idx):
+        """Current frame followed by its three previous frames, stacked as channels, without augmentation."""
+        # Extract data from the aligned frame
+        label_data, left_eye_jpeg, right_eye_jpeg, label_timestamp, previous_data = self.aligned_frames[idx]
+        
+        # Decode JPEG data for current frame
+        current_frame = self.stack_eyes(left_eye_jpeg, right_eye_jpeg)
         
         # Process previous frames
         prev_frames = []
         for prev_frame_data in previous_data:
             if prev_frame_data is not None:
                 prev_label_data, prev_left_jpeg, prev_right_jpeg, prev_timestamp, _ = prev_frame_data
-                
-                # Decode previous frame JPEG data
-                prev_left_eye = decode_jpeg(prev_left_jpeg)
-                prev_right_eye = decode_jpeg(prev_right_jpeg)
-                # Convert to grayscale if needed
-                if len(prev_left_eye.shape) == 3:
-                    prev_left_eye = cv2.cvtColor(prev_left_eye, cv2.COLOR_BGR2GRAY)
-                if len(prev_right_eye.shape) == 3:
-                    prev_right_eye = cv2.cvtColor(prev_right_eye, cv2.COLOR_BGR2GRAY)
-
-                prev_left_eye = cv2.equalizeHist(prev_left_eye)
-
-                prev_right_eye = cv2.equalizeHist(prev_right_eye)
-
-                # Normalize previous images
-                prev_left_eye = prev_left_eye.astype(np.float32)
-                prev_right_eye = prev_right_eye.astype(np.float32)
-
-                #print(prev_left_eye, prev_right_eye)
-                
-                prev_left_eye /= 255.
-                prev_right_eye /= 255.
-                
-                # Stack previous frame channels
-                if self.side == 'left':
-                    prev_frame = np.stack([prev_left_eye,], axis=0)
-                else:
-                    prev_frame = np.stack([prev_right_eye,], axis=0)
-                prev_frames.append(prev_frame)
+                prev_frames.append(self.stack_eyes(prev_left_jpeg, prev_right_jpeg))
             else:
                 # If previous frame is None, use zeros
                 prev_frames.append(np.zeros_like(current_frame))
@@ -1023,24 +1230,74 @@ class CaptureDataset(Dataset):
         image = np.concatenate(all_frames, axis=0)
         
         # Convert to tensor for augmentations
-        image = torch.from_numpy(image).float()
-        # print(image)
+        return torch.from_numpy(image).float()
 
-        # Apply augmentations during training
-        if TRAINING:
-            # Apply spatial transformations (50% chance)
-            if np.random.random() < 0.2:
-                image = apply_spatial_transformations(image, max_shift=24, max_rotation=10, max_scale=0.1)
-        
+    def draw_augmentation(self):
+        """
+        Draw the augmentations of one sample before it is decoded, one plan per eye.
+        Each plan holds the parameters of every augmentation that applies (None for
+        the others), drawn in the same order as applying them draws, so a seed gives
+        the same augmentation either way.
+        """
+        rng = augmentation_rng()
+        # The shift is in pixels of a full-resolution frame
+        max_shift = 24 * (self.resolution or RESOLUTION) // INPUT_SIZE
+        plans = []
+        # Each eye has its own camera, so with side='both' the eyes are augmented independently
+        for _ in range(2 if self.side == 'both' else 1):
+            plan = {'spatial': None, 'intensity': None, 'blur': None}
+            # Apply spatial transformations (20% chance)
+            if rng.random() < 0.2:
+                plan['spatial'] = draw_spatial_params(rng, max_shift=max_shift, max_rotation=10, max_scale=0.1)
             # Apply intensity transformations (30% chance)
-            if np.random.random() < 0.3:
-                image = apply_intensity_transformations(image, brightness_range=0.1, contrast_range=0.6)
-            
+            if rng.random() < 0.3:
+                plan['intensity'] = draw_intensity_params(rng, brightness_range=0.1, contrast_range=0.6)
             # Apply blur (20% chance)
-            if np.random.random() < 0.2:
-                image = apply_blur(image, max_kernel_size=5)
+            if rng.random() < 0.2:
+                plan['blur'] = draw_blur_params(rng, max_kernel_size=5)
+            plans.append(plan)
+        return plans
+
+    @staticmethod
+    def augments(plans):
+        """Whether plans from draw_augmentation() change the image at all."""
+        return plans is not None and any(value is not None for plan in plans for value in plan.values())
+
+    def apply_augmentation(self, image, plans, stages=("spatial", "intensity", "blur")):
+        """
+        Apply the augmentations drawn by draw_augmentation(); plans=None leaves the
+        image untouched. stages limits which of them run, always in this order.
+        """
+        if plans is None:
+            return image
+        if len(plans) == 1:
+            return self.apply_eye_augmentation(image, plans[0], stages)
+
+        # Interleaved eyes: channel i belongs to eye i % len(plans)
+        augmented = torch.empty_like(image)
+        for i, plan in enumerate(plans):
+            augmented[i::len(plans)] = self.apply_eye_augmentation(image[i::len(plans)], plan, stages)
+        return augmented
+
+    def apply_eye_augmentation(self, image, plan, stages=("spatial", "intensity", "blur")):
+        """Augment the channels of one eye with the parameters in plan."""
+        if plan['spatial'] is not None and "spatial" in stages:
+            image = apply_spatial_transformations(image, params=plan['spatial'])
+        if plan['intensity'] is not None and "intensity" in stages:
+            image = apply_intensity_transformations(image, params=plan['intensity'])
+        if plan['blur'] is not None and "blur" in stages:
+            image = apply_blur(image, params=plan['blur'])
+        return image
+
+    def load_label(self, idx):
+        """
+        Normalized training target for one sample.
+
+        Returns:
+            tuple: (label array, is_safe_frame)
+        """
+        label_data = self.aligned_frames[idx][0]
 
-        
         # Extract label information including new parameters
         (routine_pitch, routine_yaw, routine_distance, routine_convergence, fov_adjust_distance,
          left_eye_pitch, left_eye_yaw, right_eye_pitch, right_eye_yaw,
@@ -1138,19 +1395,17 @@ class CaptureDataset(Dataset):
         #label = np.array([norm_pitchL, norm_yawL, norm_pitchR, norm_yawR], dtype=np.float32)
         if self.side == 'left':
             label = np.array([norm_pitchL, norm_yawL, left_lid], dtype=np.float32)
+        elif self.side == 'both':
+            label = np.array([norm_pitchL, norm_yawL, left_lid, norm_pitchR, norm_yawR, right_lid], dtype=np.float32)
         else:
             label = np.array([norm_pitchR, norm_yawR, right_lid], dtype=np.float32)
             
         #label = np.array([norm_pitch, norm_yaw, 0.5, left_lid], dtype=np.float32)
         # Determine if this is a "safe" frame
         is_safe_frame = (routine_state == 67108864) or self.force_zero
-        
-        # Apply any additional transforms if provided
-        if self.transform:
-            image = self.transform(image)
-        
-        return image.to(DEVICE), torch.from_numpy(label).to(DEVICE), is_safe_frame
-    
+
+        return label, is_safe_frame
+
     def get_raw_frame(self, idx):
         """Return the raw frame for video rendering"""
         # Create a compatible structure to match the original API
@@ -1183,7 +1438,765 @@ class CaptureDataset(Dataset):
         
         return frame
 
-def train_model(model, decoder, train_loader, num_epochs=10, lr=5e-5, class_step=False, e_add = 0, e_total = 0):
+class ThreadBudget:
+    """
+    Split of the CPU between torch compute, OpenCV and loader threads.
+
+    OpenCV's own thread pool in the decode/augment path competes with torch's
+    intra-op pool for the same cores. The budget keeps every pool inside the
+    physical core count: loader workers get their share of cores and decode with
+    single-threaded OpenCV calls, torch gets the rest. The torch DataLoader
+    decodes in the training thread, so without the threaded loader there are no
+    loader workers and torch gets every core.
+    """
+    def __init__(self, torch_threads, interop_threads, cv2_threads, loader_workers, physical_cores):
+        self.torch_threads = max(1, torch_threads)
+        self.interop_threads = max(1, interop_threads)
+        self.cv2_threads = max(1, cv2_threads)
+        self.loader_workers = max(0, loader_workers)
+        self.physical_cores = physical_cores
+
+    @staticmethod
+    def detect_physical_cores():
+        """Physical cores available to this process (logical CPUs when that can't be determined)."""
+        logical = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+        if psutil is not None:
+            physical = psutil.cpu_count(logical=False)
+            total_logical = psutil.cpu_count(logical=True)
+            if physical and total_logical:
+                # Scale by the affinity mask in case we were pinned to a subset
+                return max(1, round(physical * logical / total_logical))
+        return max(1, logical)
+
+    @classmethod
+    def default(cls, cores=None, threaded_loader=True):
+        cores = cores or cls.detect_physical_cores()
+        workers = max(1, cores // 4) if threaded_loader else 0
+        return cls(torch_threads=max(1, cores - workers), interop_threads=1, cv2_threads=1,
+                   loader_workers=workers, physical_cores=cores)
+
+    @classmethod
+    def from_spec(cls, spec, cores=None, threaded_loader=True):
+        """
+        Build a budget from a user override such as "torch=6,workers=2,cv2=1,interop=1".
+        Keys that are left out keep their default value; every share must be at
+        least 1, and workers is only accepted with the threaded loader.
+        """
+        budget = cls.default(cores, threaded_loader)
+        keys = {'torch': 'torch_threads', 'interop': 'interop_threads', 'cv2': 'cv2_threads', 'workers': 'loader_workers'}
+        for part in spec.split(','):
+            if not part.strip():
+                continue
+            key, _, value = part.partition('=')
+            key, value = key.strip(), value.strip()
+            if key not in keys or not value.isdigit() or int(value) < 1:
+                raise ValueError(f"Invalid thread budget entry '{part}', expected one of {', '.join(keys)} with a value of at least 1")
+            if key == 'workers' and not threaded_loader:
+                raise ValueError("Thread budget entry 'workers' only applies to --loader threaded")
+            setattr(budget, keys[key], int(value))
+        return budget
+
+    def apply(self):
+        torch.set_num_threads(self.torch_threads)
+        try:
+            torch.set_num_interop_threads(self.interop_threads)
+        except RuntimeError as e:
+            # Can only be set once, before any inter-op parallel work has started
+            print("Could not set %d inter-op threads, keeping %d: %s" % (self.interop_threads, torch.get_num_interop_threads(), e), flush=True)
+        cv2.setNumThreads(self.cv2_threads)
+
+    def describe(self):
+        loader = "loader workers %d" % self.loader_workers if self.loader_workers else "loading in the training thread"
+        return ("Thread budget: %d physical cores -> torch %d (interop %d), %s, OpenCV %d" %
+                (self.physical_cores, self.torch_threads, self.interop_threads, loader, self.cv2_threads))
+
+def autotune_thread_budget(budget, dataset, model, args, steps=6):
+    """
+    Try a few worker/torch splits with short warm-up training runs on a copy of
+    the model and keep the split with the highest samples/sec.
+    """
+    cores = budget.physical_cores
+    candidates = sorted({1, 2, max(1, cores // 4), max(1, cores // 2)})
+    criterion = nn.MSELoss()
+    best, best_rate = budget, 0.0
+
+    for workers in candidates:
+        if workers >= cores and cores > 1:
+            continue
+        trial = ThreadBudget(max(1, cores - workers), budget.interop_threads, budget.cv2_threads, workers, cores)
+        trial.apply()
+        args.loader_workers = workers
+
+        warm = copy.deepcopy(model).to(DEVICE).train()
+        optimizer = optim.AdamW(warm.parameters(), lr=0.0)
+        seen = 0
+        start = None
+        for i, batch in enumerate(make_loader(dataset, args, shuffle=True)):
+            if i == 1:
+                # Skip the first batch, which pays for filling the prefetch queue
+                start = time.time()
+            elif i > 1:
+                seen += batch[0].shape[0]
+            optimizer.zero_grad()
+            loss = calibration_loss(warm, criterion, warm(batch[0].to(DEVICE)), batch[1].to(DEVICE))
+            loss.backward()
+            optimizer.step()
+            if i >= steps:
+                break
+
+        rate = seen / max(time.time() - start, 1e-9) if start is not None else 0.0
+        print("Thread autotune: torch %d / workers %d -> %.1f samples/s" % (trial.torch_threads, workers, rate), flush=True)
+        if rate > best_rate:
+            best, best_rate = trial, rate
+
+    best.apply()
+    args.loader_workers = best.loader_workers
+    return best
+
+def scaled_lr(batch_size, rule="sqrt", base_lr=BASE_LR, base_batch_size=BASE_BATCH_SIZE):
+    """Learning rate for batch_size, scaled from the base LR by the linear or square-root rule."""
+    ratio = batch_size / base_batch_size
+    if rule == "linear":
+        return base_lr * ratio
+    if rule == "sqrt":
+        return base_lr * ratio ** 0.5
+    return base_lr
+
+def machine_key(model, args):
+    """Identifies this machine and training setup in the batch size cache."""
+    return "|".join([platform.node(), platform.machine(), platform.processor() or "?", str(os.cpu_count()),
+                     str(DEVICE), torch.__version__, "in%d" % input_channels(model), args.precision, args.compile])
+
+def load_batch_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def estimate_training_memory_mb(model, inputs):
+    """
+    Rough peak memory of one training step: every layer output is kept for the
+    backward pass and gets a gradient of the same size, plus the weights with
+    their gradients and two AdamW moments.
+    """
+    sizes = []
+    hooks = [m.register_forward_hook(lambda m, i, o: sizes.append(o.numel() * o.element_size()))
+             for m in model.modules() if not list(m.children())]
+    try:
+        with torch.no_grad():
+            model(inputs, return_blends=True)
+    finally:
+        for h in hooks:
+            h.remove()
+    weights = sum(p.numel() * p.element_size() for p in model.parameters())
+    return (2 * (sum(sizes) + inputs.numel() * inputs.element_size()) + 4 * weights) / 2**20
+
+def autotune_batch_size(dataset, model, args, candidates=(16, 32, 64, 128), seconds=2.0):
+    """
+    Time the real training step at a few batch sizes and keep the fastest one
+    whose peak memory stays under --batch-memory-mb, then scale the LR to match.
+
+    Results are cached per machine in --batch-cache, so only the first calibration
+    on a machine pays for the probing. The batches are decoded once up front, so
+    the timing measures the step itself rather than JPEG decoding.
+
+    Returns:
+        int: the selected batch size (also stored in args.batch_size, with args.lr)
+    """
+    if not is_main_process():
+        # Rank 0 probes and the others follow, so every rank takes the same number of steps
+        args.batch_size = broadcast_from_main(None)
+        args.lr = scaled_lr(args.batch_size, args.lr_scaling)
+        return args.batch_size
+
+    key = machine_key(model, args)
+    cache = load_batch_cache(args.batch_cache)
+    if key in cache:
+        args.batch_size = broadcast_from_main(cache[key]['batch_size'])
+        args.lr = scaled_lr(args.batch_size, args.lr_scaling)
+        print("Batch autotune: cached batch size %d, lr %.6f" % (args.batch_size, args.lr), flush=True)
+        return args.batch_size
+
+    criterion = nn.MSELoss()
+    use_bf16 = args.precision == "bf16" and str(DEVICE) == "cpu"
+    inputs, labels, _ = next(iter(make_loader(dataset, args, shuffle=True, batch_size=max(candidates))))
+    inputs, labels = inputs.to(DEVICE), labels.to(DEVICE)
+
+    rates = {}
+    for batch_size in candidates:
+        if batch_size > inputs.shape[0]:
+            continue
+        warm = copy.deepcopy(model).to(DEVICE).train()
+        step_model = compile_for_training(warm, args.compile)
+        optimizer = optim.AdamW(warm.parameters(), lr=0.0)
+        x, y = inputs[:batch_size], labels[:batch_size]
+        if args.compile != "off":
+            x = x.contiguous(memory_format=torch.channels_last)
+
+        if torch.cuda.is_available() and str(DEVICE) == "cuda":
+            torch.cuda.reset_peak_memory_stats()
+
+        steps = 0
+        start = None
+        while start is None or time.time() - start < seconds / len(candidates):
+            optimizer.zero_grad()
+            with autocast_context(use_bf16):
+                outputs = step_model(x, return_blends=True)
+            loss = calibration_loss(warm, criterion, outputs.float(), y)
+            loss.backward()
+            optimizer.step()
+            if start is None:
+                # The first step pays for allocation and warm-up
+                start = time.time()
+            else:
+                steps += 1
+        rate = steps * batch_size / max(time.time() - start, 1e-9)
+
+        if torch.cuda.is_available() and str(DEVICE) == "cuda":
+            peak_mb = torch.cuda.max_memory_allocated() / 2**20
+        else:
+            # The CPU allocator reuses freed blocks, so process RSS says little; estimate instead
+            peak_mb = estimate_training_memory_mb(warm, x)
+        del warm, step_model, optimizer
+
+        over = peak_mb > args.batch_memory_mb
+        print("Batch autotune: batch %d -> %.1f samples/s, ~%.0f MB%s" %
+              (batch_size, rate, peak_mb, " (over the memory cap)" if over else ""), flush=True)
+        if not over:
+            rates[batch_size] = rate
+
+    best = max(rates, key=rates.get) if rates else BASE_BATCH_SIZE
+    # Stay on the tuned default unless another size is clearly faster
+    if BASE_BATCH_SIZE in rates and rates[best] < rates[BASE_BATCH_SIZE] * 1.05:
+        best = BASE_BATCH_SIZE
+
+    args.batch_size = broadcast_from_main(best)
+    args.lr = scaled_lr(best, args.lr_scaling)
+    print("Batch autotune: using batch size %d, lr %.6f (%s scaling)" % (best, args.lr, args.lr_scaling), flush=True)
+
+    cache[key] = {'batch_size': best, 'samples_per_sec': {str(b): r for b, r in rates.items()}, 'time': time.time()}
+    try:
+        with open(args.batch_cache, "w") as f:
+            json.dump(cache, f, indent=2)
+    except OSError as e:
+        print("Could not write batch size cache %s: %s" % (args.batch_cache, e), flush=True)
+    return best
+
+class PrefetchLoader:
+    """
+    Thread-based replacement for DataLoader.
+
+    Multiprocessing workers are fragile inside the frozen (PyInstaller) build,
+    especially with the Windows spawn start method. This loader decodes and
+    augments samples on a thread pool instead (cv2 and NumPy release the GIL
+    for the heavy lifting) and keeps a bounded number of upcoming batches in
+    flight, so the next batch is usually ready when the training step finishes.
+    Each sample draws its augmentation from its own generator, seeded from
+    (seed, epoch, position in the epoch), so results don't depend on which
+    thread runs it or when.
+
+    Args:
+        dataset: Map-style dataset returning (image, label, state) tuples
+        batch_size: Samples per batch
+        shuffle: Draw a new random order every epoch
+        sampler: Optional iterable of indices, overrides shuffle
+        num_workers: Decode/augment threads
+        prefetch_batches: Batches kept in flight ahead of the consumer (2 = double buffer)
+        drop_last: Drop the final incomplete batch
+        collate_fn: Merges a list of samples into a batch
+        seed: Base seed of the per-sample augmentation generators
+    """
+    def __init__(self, dataset, batch_size=32, shuffle=False, sampler=None, num_workers=2, prefetch_batches=2, drop_last=False,
+                 collate_fn=default_collate, seed=0):
+        self.dataset = dataset
+        self.seed = seed
+        # Counts passes when the sampler doesn't carry an epoch number
+        self.epoch = 0
+        self.collate_fn = collate_fn
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.sampler = sampler
+        self.num_workers = max(1, num_workers)
+        self.prefetch_batches = max(1, prefetch_batches)
+        self.drop_last = drop_last
+
+    def __len__(self):
+        n = len(self.sampler) if self.sampler is not None else len(self.dataset)
+        if self.drop_last:
+            return n // self.batch_size
+        return (n + self.batch_size - 1) // self.batch_size
+
+    def _batch_indices(self):
+        if self.sampler is not None:
+            order = list(self.sampler)
+        elif self.shuffle:
+            order = torch.randperm(len(self.dataset)).tolist()
+        else:
+            order = list(range(len(self.dataset)))
+
+        batches = [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+        if self.drop_last and batches and len(batches[-1]) < self.batch_size:
+            batches.pop()
+        return batches
+
+    def _load(self, idx, epoch, position):
+        _augmentation_rng.rng = np.random.RandomState([self.seed, epoch, position])
+        try:
+            return self.dataset[idx]
+        finally:
+            _augmentation_rng.rng = None
+
+    def __iter__(self):
+        pending = deque(self._batch_indices())
+        in_flight = deque()
+        epoch = getattr(self.sampler, "epoch", self.epoch)
+        self.epoch += 1
+        # A resumed epoch continues at the sampler's start position
+        position = getattr(self.sampler, "start", 0)
+
+        pool = ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="prefetch")
+        try:
+            while pending or in_flight:
+                # Keep the queue topped up before handing out the oldest batch
+                while pending and len(in_flight) < self.prefetch_batches:
+                    indices = pending.popleft()
+                    in_flight.append([pool.submit(self._load, idx, epoch, position + i) for i, idx in enumerate(indices)])
+                    position += len(indices)
+
+                futures = in_flight.popleft()
+                yield self.collate_fn([f.result() for f in futures])
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+class EpochSampler(Sampler):
+    """
+    Shuffling sampler that remembers each epoch's order, so a checkpoint can
+    record it and a resumed run can continue from the middle of the epoch.
+
+    With world_size > 1 every rank draws the same seeded permutation for the
+    epoch and keeps every world_size-th frame from its rank on, padded so all
+    ranks take the same number of steps.
+    """
+    def __init__(self, num_samples, shuffle=True, rank=0, world_size=1, seed=0):
+        self.num_samples = num_samples
+        self.shuffle = shuffle
+        self.rank = rank
+        self.world_size = world_size
+        self.seed = seed
+        self.epoch = 0
+        self.order = None
+        self.start = 0
+        self._resume = None
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def shard(self):
+        """This rank's share of the epoch's order."""
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        order = torch.randperm(self.num_samples, generator=generator).tolist() if self.shuffle else list(range(self.num_samples))
+        padded = -(-self.num_samples // self.world_size) * self.world_size
+        order += order[:padded - self.num_samples]
+        return order[self.rank::self.world_size]
+
+    def resume_from(self, order, start):
+        """Make the next iteration continue order from position start."""
+        self._resume = (list(order), start)
+
+    def __iter__(self):
+        if self._resume is not None:
+            self.order, self.start = self._resume
+            self._resume = None
+        else:
+            if self.world_size > 1:
+                self.order = self.shard()
+            else:
+                self.order = torch.randperm(self.num_samples).tolist() if self.shuffle else list(range(self.num_samples))
+            self.start = 0
+        return iter(self.order[self.start:])
+
+    def __len__(self):
+        if self._resume is not None:
+            return len(self._resume[0]) - self._resume[1]
+        return -(-self.num_samples // self.world_size)
+
+class LossAwareSampler(EpochSampler):
+    """
+    Draws frames (with replacement) in proportion to their running training loss,
+    so frames the model already fits well come up less often.
+
+    train_model() feeds every step's per-frame losses back through update() and
+    scales them by importance_weights(), which keeps the loss an unbiased estimate
+    of the uniform-sampling loss.
+
+    Args:
+        num_samples: Frames in the dataset
+        epoch_fraction: Draws per epoch as a fraction of num_samples
+        floor: Share of the probability mass spread uniformly, so no frame is starved
+        momentum: Weight of the previous value in the running per-frame loss
+    """
+    def __init__(self, num_samples, epoch_fraction=1.0, floor=0.2, momentum=0.7):
+        super().__init__(num_samples)
+        self.num_draws = max(1, int(round(num_samples * epoch_fraction)))
+        self.floor = floor
+        self.momentum = momentum
+        self.scores = np.zeros(num_samples, dtype=np.float64)
+        self.seen = np.zeros(num_samples, dtype=bool)
+        self.probs = np.full(num_samples, 1.0 / num_samples)
+
+    def probabilities(self):
+        if not self.seen.any():
+            return np.full(self.num_samples, 1.0 / self.num_samples)
+        # Frames not drawn yet count as average so they still get picked
+        scores = np.where(self.seen, self.scores, self.scores[self.seen].mean()) + 1e-12
+        return (1.0 - self.floor) * scores / scores.sum() + self.floor / self.num_samples
+
+    def __iter__(self):
+        if self._resume is not None:
+            self.order, self.start = self._resume
+            self._resume = None
+        else:
+            self.probs = self.probabilities()
+            self.order = torch.multinomial(torch.from_numpy(self.probs), self.num_draws, replacement=True).tolist()
+            self.start = 0
+        return iter(self.order[self.start:])
+
+    def __len__(self):
+        if self._resume is not None:
+            return len(self._resume[0]) - self._resume[1]
+        return self.num_draws
+
+    def update(self, indices, losses):
+        """Fold one step's per-frame losses into the running scores."""
+        losses = losses.float().cpu().numpy()
+        for idx, loss in zip(indices, losses):
+            if self.seen[idx]:
+                self.scores[idx] = self.momentum * self.scores[idx] + (1.0 - self.momentum) * loss
+            else:
+                self.scores[idx] = loss
+                self.seen[idx] = True
+
+    def importance_weights(self, indices, device=DEVICE):
+        """1 / (N p) for each drawn frame, undoing the bias of non-uniform sampling."""
+        return torch.tensor(1.0 / (self.num_samples * self.probs[indices]), dtype=torch.float32, device=device)
+
+    def state_dict(self):
+        return {'scores': self.scores, 'seen': self.seen, 'probs': self.probs}
+
+    def load_state_dict(self, state):
+        self.scores, self.seen, self.probs = state['scores'], state['seen'], state['probs']
+
+def init_distributed(args):
+    """
+    Join the gloo process group when launched by torchrun with --distributed.
+
+    Returns:
+        tuple: (rank, world_size), (0, 1) when training in a single process
+
+    Raises:
+        RuntimeError: --distributed without the environment torchrun sets up
+    """
+    if not args.distributed:
+        return 0, 1
+    missing = [name for name in ("WORLD_SIZE", "RANK") if name not in os.environ]
+    if missing:
+        raise RuntimeError("--distributed has to be launched with torchrun, %s not set; "
+                           "e.g. torchrun --nproc_per_node=2 trainermin.py ... --distributed" % ", ".join(missing))
+    dist.init_process_group(backend="gloo")
+    return dist.get_rank(), dist.get_world_size()
+
+def distributed_world():
+    """(rank, world_size) of this process, (0, 1) outside a process group."""
+    if dist.is_available() and dist.is_initialized():
+        return dist.get_rank(), dist.get_world_size()
+    return 0, 1
+
+def is_main_process():
+    return distributed_world()[0] == 0
+
+def broadcast_from_main(value):
+    """Rank 0's value on every rank; value itself outside distributed training."""
+    if distributed_world()[1] == 1:
+        return value
+    values = [value]
+    dist.broadcast_object_list(values, src=0)
+    return values[0]
+
+def make_loader(dataset, args, shuffle=True, sampler=None, batch_size=None, collate_fn=default_collate):
+    """Build the training loader selected on the command line."""
+    batch_size = batch_size or getattr(args, "batch_size", BASE_BATCH_SIZE)
+    if args.loader == "threaded":
+        return PrefetchLoader(dataset, batch_size=batch_size, shuffle=shuffle, sampler=sampler,
+                              num_workers=args.loader_workers, prefetch_batches=args.prefetch_batches,
+                              collate_fn=collate_fn, seed=distributed_world()[0])
+    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle if sampler is None else False,
+                      sampler=sampler, num_workers=0, collate_fn=collate_fn)
+
+def calibration_loss(model, criterion, outputs, labels):
+    if outputs.shape[-1] == 6:
+        # Joint step over both eyes: one loss per tower, summed so each
+        # tower sees the same gradient it would get when trained alone
+        return criterion(outputs[:, :3], labels[:, :3]) + criterion(outputs[:, 3:], labels[:, 3:])
+    return criterion(outputs, labels)
+
+def per_sample_loss(outputs, labels):
+    """Per-frame calibration_loss (with MSE); its batch mean equals calibration_loss."""
+    return ((outputs - labels) ** 2).view(outputs.shape[0], -1, 3).mean(dim=2).sum(dim=1)
+
+def autocast_context(enabled):
+    """CPU bf16 autocast when enabled, otherwise a no-op context."""
+    if enabled:
+        return torch.autocast(device_type="cpu", dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+def input_channels(model):
+    return 8 if isinstance(model, MultiChad) else model.conv1.in_channels
+
+def compile_for_training(model, mode):
+    """
+    Prepare the module used for training steps.
+
+    Every mode other than "off" moves the weights to channels_last, which lets the
+    oneDNN convolution kernels skip layout conversions. "compile" additionally wraps
+    the model with torch.compile. Compilation needs a working compiler toolchain that
+    the frozen build usually lacks, so a failed warm-up falls back to eager execution.
+
+    Returns:
+        The callable to use for forward passes; parameters stay shared with model
+    """
+    if mode == "off":
+        return model
+
+    model = model.to(memory_format=torch.channels_last)
+    if mode != "compile":
+        return model
+
+    if not hasattr(torch, "compile"):
+        print("torch.compile is not available, using eager channels_last", flush=True)
+        return model
+
+    try:
+        compiled = torch.compile(model)
+        # Compilation happens on first use, so run a warm-up step to surface errors here
+        example = torch.zeros(2, input_channels(model), RESOLUTION, RESOLUTION, device=DEVICE).contiguous(memory_format=torch.channels_last)
+        compiled(example).sum().backward()
+        model.zero_grad(set_to_none=True)
+        return compiled
+    except Exception as e:
+        model.zero_grad(set_to_none=True)
+        print(f"torch.compile unavailable ({type(e).__name__}: {e}), using eager channels_last", flush=True)
+        return model
+
+def optimize_for_inference(model, example):
+    """
+    Frozen TorchScript module for inference, with conv+ReLU fused where the backend
+    supports it. Falls back to the eager module if scripting fails.
+    """
+    model = model.eval().to(memory_format=torch.channels_last)
+    example = example.contiguous(memory_format=torch.channels_last)
+    try:
+        with torch.no_grad():
+            traced = torch.jit.trace(model, example)
+            return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    except Exception as e:
+        print(f"TorchScript freezing unavailable ({type(e).__name__}: {e}), using eager model", flush=True)
+        return model
+
+def split_holdout(dataset, val_fraction=0.1, block_size=32, seed=0):
+    """
+    Split a dataset into train/validation subsets.
+
+    Neighbouring frames are nearly identical, so the split is done on contiguous
+    blocks of frames rather than single frames to keep the validation set honest.
+
+    Returns:
+        tuple: (train_subset, val_subset)
+    """
+    n = len(dataset)
+    blocks = [list(range(i, min(i + block_size, n))) for i in range(0, n, block_size)]
+    rng = np.random.RandomState(seed)
+    n_val = min(len(blocks) - 1, max(1, int(round(len(blocks) * val_fraction))))
+    val_blocks = set(rng.choice(len(blocks), n_val, replace=False).tolist())
+
+    train_idx, val_idx = [], []
+    for b, block in enumerate(blocks):
+        (val_idx if b in val_blocks else train_idx).extend(block)
+
+    # Validation reads through a shallow copy that never augments, so evaluating
+    # mid-epoch doesn't race with prefetch threads decoding training samples
+    val_view = copy.copy(dataset)
+    val_view.augment = False
+    return Subset(dataset, train_idx), Subset(val_view, val_idx)
+
+def evaluate_model(model, loader):
+    """
+    Batched no-grad evaluation. The loader should come from a non-augmenting
+    dataset such as the validation half of split_holdout().
+
+    Returns:
+        dict: mean MSE over all outputs and mean absolute gaze error in degrees
+    """
+    total_mse = 0.0
+    total_gaze = 0.0
+    count = 0
+    model.eval()
+    try:
+        with torch.no_grad():
+            for batch in loader:
+                inputs, labels = batch[0].to(DEVICE), batch[1].to(DEVICE)
+                outputs = model(inputs)
+                gaze_cols = [0, 1, 3, 4] if outputs.shape[-1] == 6 else [0, 1]
+                total_mse += ((outputs - labels) ** 2).mean(dim=1).sum().item()
+                # Gaze labels are (angle + 45) / 90, so the error scales back to degrees
+                total_gaze += ((outputs[:, gaze_cols] - labels[:, gaze_cols]).abs().mean(dim=1) * 90.0).sum().item()
+                count += inputs.shape[0]
+    finally:
+        model.train()
+
+    return {
+        'mse': total_mse / max(1, count),
+        'gaze_error_deg': total_gaze / max(1, count)
+    }
+
+def capture_rng_state():
+    return {'torch': torch.get_rng_state(), 'numpy': np.random.get_state(), 'python': random.getstate()}
+
+def restore_rng_state(state):
+    torch.set_rng_state(state['torch'])
+    np.random.set_state(state['numpy'])
+    random.setstate(state['python'])
+
+def _cpu_copy(obj):
+    """Deep copy of a (nested) checkpoint payload with every tensor cloned to the CPU."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().cpu().clone()
+    if isinstance(obj, dict):
+        return {k: _cpu_copy(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_cpu_copy(v) for v in obj)
+    return copy.deepcopy(obj)
+
+class CheckpointWriter:
+    def __init__(self, path, joint=False, completed=None):
+        """
+        Crash-safe training checkpoints written off the training thread.
+
+        The training thread only snapshots tensors to the CPU; a background thread
+        serialises the newest snapshot to a temporary file and atomically renames
+        it over the previous checkpoint, so a kill at any point leaves either the
+        old or the new checkpoint intact. Snapshots that are superseded before
+        they are written are dropped.
+
+        Args:
+            path: Checkpoint file
+            joint: Whether the run trains both eyes jointly (must match on resume)
+            completed: Final state dicts of eyes that already finished
+        """
+        self.path = path
+        self.context = {'joint': joint, 'completed': dict(completed or {})}
+        self.pending = queue.Queue(maxsize=1)
+        self.writes = 0
+        self.thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def load(path):
+        if not os.path.exists(path):
+            print(f"No checkpoint found at {path}, starting from scratch", flush=True)
+            return None
+        checkpoint = torch.load(path, map_location="cpu", weights_only=False)
+        phase = checkpoint['phase']
+        print("Resuming from %s: %s eye, %s phase" % (path, phase['eye'], phase['stage']), flush=True)
+        return checkpoint
+
+    def save(self, phase, state):
+        """Queue a snapshot of state for the given phase ({'eye': ..., 'stage': ...})."""
+        snapshot = _cpu_copy({'context': self.context, 'phase': phase, 'state': state})
+        while True:
+            try:
+                self.pending.put_nowait(snapshot)
+                return
+            except queue.Full:
+                try:
+                    self.pending.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def mark_completed(self, eye, model):
+        """Record a finished eye so a resumed run skips it."""
+        self.context['completed'][eye] = _cpu_copy(model.state_dict())
+        self.save({'eye': eye, 'stage': 'done'}, None)
+
+    def _run(self):
+        while True:
+            snapshot = self.pending.get()
+            if snapshot is None:
+                return
+            tmp_path = self.path + ".tmp"
+            try:
+                torch.save(snapshot, tmp_path)
+                os.replace(tmp_path, self.path)
+                self.writes += 1
+            except Exception as e:
+                print(f"Failed to write checkpoint: {e}", flush=True)
+
+    def close(self, remove=False):
+        """Flush the pending snapshot and stop the writer; remove deletes the checkpoint."""
+        self.pending.put(None)
+        self.thread.join()
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+class EarlyStopping:
+    def __init__(self, patience=3, min_delta=0.0):
+        """
+        Track a validation metric during training and keep the best weights.
+
+        Args:
+            patience: Evaluations without improvement before stopping (None = never stop)
+            min_delta: Minimum decrease of the metric that counts as an improvement
+        """
+        self.patience = patience
+        self.min_delta = min_delta
+
+        self.best = float('inf')
+        self.best_state = None
+        self.best_epoch = None
+        self.bad_evals = 0
+        self.stopped_epoch = None
+
+    def update(self, metric, model, epoch):
+        """Record one evaluation. Returns True when training should stop."""
+        # Any improvement updates the kept weights, only a significant one resets patience
+        significant = metric < self.best - self.min_delta
+        if metric < self.best:
+            self.best = metric
+            self.best_state = {k: v.detach().cpu().clone() for k, v in model.state_dict().items()}
+            self.best_epoch = epoch
+        self.bad_evals = 0 if significant else self.bad_evals + 1
+
+        if self.patience is not None and self.bad_evals >= self.patience:
+            self.stopped_epoch = epoch
+            return True
+        return False
+
+    def reset(self):
+        """Forget the best weights so far, e.g. once the model's structure has changed."""
+        self.best = float('inf')
+        self.best_state = None
+        self.best_epoch = None
+        self.bad_evals = 0
+
+    def restore(self, model):
+        """Load the best weights seen so far back into model."""
+        if self.best_state is not None:
+            model.load_state_dict(self.best_state)
+
+def train_model(model, decoder, train_loader, num_epochs=10, lr=5e-5, class_step=False, e_add = 0, e_total = 0, precision="fp32", history=None, compile_mode="off",
+                val_loader=None, eval_every=0, early_stopping=None, checkpointer=None, phase=None, checkpoint_every=0, resume_state=None,
+                qat_epochs=0, resize_schedule=None):
     device = DEVICE#torch.device("cuda:0")
     print(f"Using device: {device}", flush=True)
     
@@ -1200,7 +2213,7 @@ def train_model(model, decoder, train_loader, num_epochs=10, lr=5e-5, class_step
 
     model = model.to(DEVICE)
     #decoder = decoder.to(DEVICE)
-    optimizerE = optim.AdamW(list(model.parameters()), lr=0.001)
+    optimizerE = optim.AdamW(list(model.parameters()), lr=lr)
 
     def warmup_fn(epoch):
         return min(1.0, epoch / 5)  # Gradually increase LR for first 5 epochs
@@ -1212,22 +2225,121 @@ def train_model(model, decoder, train_loader, num_epochs=10, lr=5e-5, class_step
 
     cosine_scheduler = CosineAnnealingLR(optimizerE, T_max=T_max, eta_min=eta_min)
 
-    
-    for epoch in range(num_epochs):
+    # bf16 autocast only covers the forward pass; weights, optimizer state and the loss stay fp32
+    use_bf16 = precision == "bf16" and str(device) == "cpu"
+    if precision == "bf16" and not use_bf16:
+        print(f"bf16 autocast is only supported on the CPU, training {device} in fp32", flush=True)
+
+    channels_last = compile_mode != "off"
+
+    def build_step_model():
+        # Parameters are shared, so model itself stays a plain module for saving and export
+        step_model = compile_for_training(model, compile_mode)
+        if distributed_world()[1] > 1:
+            # Gradients are averaged across ranks during backward(), so every rank takes the same step
+            step_model = DistributedDataParallel(step_model)
+        return step_model
+
+    if val_loader is not None and early_stopping is None:
+        early_stopping = EarlyStopping(patience=None)
+
+    last_metrics = {}
+
+    def validate(epoch):
+        metrics = evaluate_model(model, val_loader)
+        last_metrics.update(metrics)
+        print("Validation: MSE %.6f, gaze error %.3f deg" % (metrics['mse'], metrics['gaze_error_deg']), flush=True)
+        return early_stopping.update(metrics['mse'], model, epoch)
+
+    # Mid-epoch checkpoints need to know the epoch's sample order
+    sampler = getattr(train_loader, "sampler", None)
+    if not isinstance(sampler, EpochSampler):
+        sampler = None
+    loss_aware = isinstance(sampler, LossAwareSampler)
+
+    def checkpoint(epoch, position, running_loss=0.0, samples=0, batches_done=0):
+        checkpointer.save(phase, {
+            'model': model.state_dict(),
+            'optimizer': optimizerE.state_dict(),
+            'warmup_scheduler': warmup_scheduler.state_dict(),
+            'cosine_scheduler': cosine_scheduler.state_dict(),
+            'early_stopping': vars(early_stopping) if early_stopping is not None else None,
+            'epoch': epoch,
+            'position': position,
+            'order': sampler.order if position else None,
+            'running_loss': running_loss,
+            'samples': samples,
+            'batches_done': batches_done,
+            'rng': capture_rng_state(),
+            'sampler': sampler.state_dict() if loss_aware else None
+        })
+
+    start_epoch = 0
+    if resume_state is not None:
+        load_training_state(model, resume_state['model'])
+        optimizerE.load_state_dict(resume_state['optimizer'])
+        warmup_scheduler.load_state_dict(resume_state['warmup_scheduler'])
+        cosine_scheduler.load_state_dict(resume_state['cosine_scheduler'])
+        if early_stopping is not None and resume_state['early_stopping'] is not None:
+            early_stopping.__dict__.update(resume_state['early_stopping'])
+        restore_rng_state(resume_state['rng'])
+        if loss_aware and resume_state.get('sampler') is not None:
+            sampler.load_state_dict(resume_state['sampler'])
+        start_epoch = resume_state['epoch']
+        if resume_state['position'] and sampler is not None:
+            sampler.resume_from(resume_state['order'], resume_state['position'])
+        print("Resuming at epoch %d, sample %d" % (start_epoch + 1 + e_add, resume_state['position']), flush=True)
+
+    # Built after resuming, which may have added fake quantization to model
+    step_model = build_step_model()
+
+    stop = False
+    for epoch in range(start_epoch, num_epochs):
         print("\n=== Epoch %d/%d ===\n" % (epoch + 1 + e_add, e_total + 1), flush=True)#printf("\n=== Epoch %d/%d ===\n", epoch + 1, num_epochs);
+        if sampler is not None:
+            sampler.set_epoch(epoch + e_add)
+
+        size = resize_schedule[epoch] if resize_schedule is not None else None
+        if size is not None:
+            print("Training at %dx%d" % (size, size), flush=True)
+
+        if qat_epochs and epoch >= num_epochs - qat_epochs and not is_fake_quantized(model):
+            add_fake_quant(model)
+            print("Quantization-aware training from epoch %d" % (epoch + 1 + e_add), flush=True)
+            if is_fake_quantized(model):
+                # The compiled graph and the DDP wrapper still hold the unwrapped layers
+                step_model = build_step_model()
+                if early_stopping is not None:
+                    # Weights from before fake quantization can't be restored into the wrapped model
+                    early_stopping.reset()
 
         start = time.time()
         
         running_loss = 0.0
-
-        max_i = len(train_loader)
+        samples = 0
+        batches_done = 0
+        position = 0
+
+        if resume_state is not None and epoch == start_epoch and resume_state['position'] and sampler is not None:
+            running_loss = resume_state['running_loss']
+            samples = resume_state['samples']
+            batches_done = resume_state['batches_done']
+            position = resume_state['position']
+
+        batch_offset = batches_done
+        max_i = batch_offset + len(train_loader)
         
         for i, (inputs, labels, states) in enumerate(train_loader):
+            i += batch_offset
             #if i < 5:
             #    continue
             try:
                 inputs = inputs.to(device)
                 labels = labels.to(device)
+                if size is not None and inputs.shape[-1] != size:
+                    inputs = F.interpolate(inputs, size=(size, size), mode="bilinear", antialias=True, align_corners=False)
+                if channels_last:
+                    inputs = inputs.contiguous(memory_format=torch.channels_last)
 
                 raw_inputs = inputs
 
@@ -1238,11 +2350,20 @@ def train_model(model, decoder, train_loader, num_epochs=10, lr=5e-5, class_step
 
                 if class_step:
                     # print(inputs)
-                    outputs = model(inputs, return_blends=True)
+                    with autocast_context(use_bf16):
+                        outputs = step_model(inputs, return_blends=True)
+                    outputs = outputs.float()
                     #print(outputs)
                     #outputs = decoder(latents)
                     # print(labels[0])
-                    loss = criterion(outputs, labels)# / (1+(0.01 * latents.std()))
+                    if loss_aware:
+                        # Hard-example sampling: record each frame's loss and reweight it
+                        batch_indices = sampler.order[position:position + inputs.shape[0]]
+                        frame_losses = per_sample_loss(outputs, labels)
+                        sampler.update(batch_indices, frame_losses.detach())
+                        loss = (frame_losses * sampler.importance_weights(batch_indices, device=frame_losses.device)).mean()
+                    else:
+                        loss = calibration_loss(model, criterion, outputs, labels)# / (1+(0.01 * latents.std()))
  
                 # Backward pass and optimize
                 loss.backward()
@@ -1254,6 +2375,7 @@ def train_model(model, decoder, train_loader, num_epochs=10, lr=5e-5, class_step
                 # Print statistics
                 running_loss += loss.item()
                 batch_losses.append(loss.item())
+                samples += inputs.shape[0]
                 if i % 10 == 0 and not class_step:
                     # For visualization, only show the current frame (first 2 channels)
                     image = inputs[0, :2].cpu().numpy()
@@ -1275,31 +2397,2388 @@ def train_model(model, decoder, train_loader, num_epochs=10, lr=5e-5, class_step
                 import traceback
                 traceback.print_exc()
                 print("err")
+
+            batches_done += 1
+            position += inputs.shape[0]
+            if val_loader is not None and eval_every and batches_done % eval_every == 0:
+                stop = validate(epoch + 1 + e_add)
+                if stop:
+                    break
+
+            if checkpointer is not None and sampler is not None and checkpoint_every and batches_done % checkpoint_every == 0:
+                checkpoint(epoch, position, running_loss, samples, batches_done)
+
+        if val_loader is not None and not eval_every and not stop:
+            stop = validate(epoch + 1 + e_add)
         
         # Print epoch statistics
-        epoch_loss = running_loss / len(train_loader)
+        epoch_loss = running_loss / max(1, batches_done)
         epoch_losses.append(epoch_loss)
+        if history is not None:
+            elapsed = time.time() - start
+            history.append({
+                'epoch': epoch + 1 + e_add,
+                'loss': epoch_loss,
+                'seconds': elapsed,
+                'samples_per_sec': samples / max(elapsed, 1e-9),
+                'val_mse': last_metrics.get('mse'),
+                'val_gaze_error_deg': last_metrics.get('gaze_error_deg')
+            })
         #print(f"Epoch {epoch+1}/{num_epochs} completed. Average loss: {epoch_loss:.4f}")
         print("\nEpoch %d/%d completed in %.2fs. Average loss: %.6f\n" % (epoch + 1, num_epochs + 1, time.time() - start, epoch_loss), flush=True)
         #print("end: " + str(time.time() - start))
 
+        if stop:
+            print("Early stopping after epoch %d, best validation MSE %.6f at epoch %d" %
+                  (epoch + 1 + e_add, early_stopping.best, early_stopping.best_epoch), flush=True)
+            if checkpointer is not None:
+                # Recorded as finished so a resume doesn't train past the stopping point
+                checkpoint(num_epochs, 0)
+            break
+
         #s#ched.step()
         if epoch < 5:
             warmup_scheduler.step()
         else:
             cosine_scheduler.step()
 
+        if checkpointer is not None:
+            checkpoint(epoch + 1, 0)
+
+    if early_stopping is not None:
+        early_stopping.restore(model)
+
     return model, epoch_losses, batch_losses
 
+def cycle_batches(dataset, args):
+    """Endless stream of shuffled batches, reshuffling on every pass over the data."""
+    while True:
+        for batch in make_loader(dataset, args, shuffle=True):
+            yield batch
+
+def train_for_budget(model, dataset, args, budget_s, name, measure_steps=5, warmup_fraction=0.1, lr=0.001, eta_min=1e-5):
+    """
+    Fine-tune for a wall-clock budget instead of a fixed number of epochs.
+
+    A short measurement phase times the training step, then the remaining budget
+    is turned into a step count. The LR follows a linear warmup and cosine decay
+    over those steps. The last ~1/9 of the steps run without augmentation,
+    matching the 8 augmented + 1 clean epoch split of the fixed schedule.
+
+    Returns:
+        tuple: (model, report) where report holds the time used by each phase
+    """
+    global TRAINING
+
+    start = time.time()
+    deadline = start + budget_s
+    criterion = nn.MSELoss()
+
+    model = model.to(DEVICE)
+    model.train()
+    optimizer = optim.AdamW(model.parameters(), lr=lr)
+
+    # Filled in once the step time is known; the measurement steps already run
+    # on the start of the warmup ramp
+    plan = {'warmup': 10 * measure_steps, 'total': 10 * measure_steps}
+
+    def lr_factor(step):
+        if step < plan['warmup']:
+            return (step + 1) / plan['warmup']
+        progress = min(1.0, (step - plan['warmup']) / max(1, plan['total'] - plan['warmup']))
+        return (eta_min + (lr - eta_min) * 0.5 * (1 + np.cos(np.pi * progress))) / lr
+
+    scheduler = LambdaLR(optimizer, lr_lambda=lr_factor)
+
+    def run_steps(batches, count, phase_deadline, label):
+        done = 0
+        while done < count and time.time() < phase_deadline:
+            inputs, labels, _ = next(batches)
+            inputs, labels = inputs.to(DEVICE), labels.to(DEVICE)
+            optimizer.zero_grad()
+            loss = calibration_loss(model, criterion, model(inputs), labels)
+            loss.backward()
+            optimizer.step()
+            scheduler.step()
+            done += 1
+            print("\r%s %s step %u/%u, Loss: %.6f" % (name, label, done, count, float(loss)), flush=True)
+        return done
+
+    TRAINING = True
+    batches = cycle_batches(dataset, args)
+
+    # Measurement: the first step pays for filling the prefetch queue, so time the rest
+    run_steps(batches, 1, deadline, "warm-up")
+    measure_start = time.time()
+    measured = run_steps(batches, measure_steps, deadline, "warm-up")
+    sec_per_step = max(1e-3, (time.time() - measure_start) / max(1, measured))
+    warmup_done = time.time()
+
+    remaining_steps = max(2, int((deadline - warmup_done) / sec_per_step))
+    clean_steps = max(1, remaining_steps // 9)
+    aug_steps = max(1, remaining_steps - clean_steps)
+    plan['total'] = 1 + measured + aug_steps + clean_steps
+    plan['warmup'] = max(1 + measured, int(plan['total'] * warmup_fraction))
+    print("%s: %.3fs/step, planning %d augmented + %d clean steps for %.1fs" %
+          (name, sec_per_step, aug_steps, clean_steps, deadline - warmup_done), flush=True)
+
+    # Keep the clean steps' share of the budget even if the augmented phase runs slow
+    clean_reserve = clean_steps * sec_per_step
+    aug_done = run_steps(batches, aug_steps, deadline - clean_reserve, "augmented")
+    batches.close()
+    aug_end = time.time()
+
+    TRAINING = False
+    batches = cycle_batches(dataset, args)
+    clean_done = run_steps(batches, clean_steps, deadline, "clean")
+    batches.close()
+    TRAINING = True
+    end = time.time()
+
+    report = {
+        'budget_s': budget_s,
+        'warmup_s': warmup_done - start,
+        'aug_s': aug_end - warmup_done,
+        'aug_steps': aug_done,
+        'clean_s': end - aug_end,
+        'clean_steps': clean_done,
+        'total_s': end - start
+    }
+    print("Time budget (%s): warm-up %.1fs, augmented %.1fs (%d steps), clean %.1fs (%d steps), %.1fs of %.1fs used" %
+          (name, report['warmup_s'], report['aug_s'], aug_done, report['clean_s'], clean_done, report['total_s'], budget_s), flush=True)
+    return model, report
+
+def load_capture_dataset(capture, side, corpus=()):
+    dataset = CaptureDataset(capture, all_frames=False, side=side)
+    for path in corpus:
+        merge_capture(dataset, CaptureDataset(path, all_frames=False, side=side))
+    return dataset
+
+def merge_capture(dataset, other):
+    """
+    Append another capture's aligned frames to dataset. Each aligned frame carries
+    its own previous frames, so only the label extremes need combining.
+    """
+    dataset.aligned_frames.extend(other.aligned_frames)
+    for name in ('pitch_min', 'yaw_min', 'pitch_minL', 'yaw_minL', 'pitch_minR', 'yaw_minR'):
+        setattr(dataset, name, min(getattr(dataset, name), getattr(other, name)))
+    for name in ('pitch_max', 'yaw_max', 'pitch_maxL', 'yaw_maxL', 'pitch_maxR', 'yaw_maxR', 'max_convergence'):
+        setattr(dataset, name, max(getattr(dataset, name), getattr(other, name)))
+
+    dataset.pitch_range = (max(dataset.pitch_max, -dataset.pitch_min) - min(-dataset.pitch_max, dataset.pitch_min)) or 1e-6
+    dataset.pitch_rangeL = dataset.pitch_maxL - dataset.pitch_minL or 1e-6
+    dataset.pitch_rangeR = dataset.pitch_maxR - dataset.pitch_minR or 1e-6
+    dataset.yaw_range = (max(dataset.yaw_max, -dataset.yaw_min) - min(-dataset.yaw_max, dataset.yaw_min)) or 1e-6
+    dataset.yaw_rangeL = dataset.yaw_maxL - dataset.yaw_minL or 1e-6
+    dataset.yaw_rangeR = dataset.yaw_maxR - dataset.yaw_minR or 1e-6
+    print("Merged capture: %d frames in total" % len(dataset), flush=True)
+
+def load_baseline(side):
+    """Fresh baseline model for one eye, or a MultiChad holding both for side='both'."""
+    if side == 'both':
+        model = MultiChad()
+        model.left.load_state_dict(torch.load("baseline_L.pth", map_location="cpu"))
+        model.right.load_state_dict(torch.load("baseline_R.pth", map_location="cpu"))
+    else:
+        model = MicroChad()
+        model.load_state_dict(torch.load("baseline_L.pth" if side == 'left' else "baseline_R.pth", map_location="cpu"))
+    return model.to(DEVICE)
+
+def make_sampler(num_samples, args, hard_examples=True):
+    """
+    Training sampler: loss-aware with --hard-examples (when hard_examples allows
+    it), otherwise uniform, sharded across ranks in distributed training.
+    """
+    if hard_examples and args.hard_examples:
+        # parse_args rejects --hard-examples with --distributed
+        return LossAwareSampler(num_samples, epoch_fraction=args.hard_epoch_fraction, floor=args.hard_floor)
+    rank, world_size = distributed_world()
+    return EpochSampler(num_samples, rank=rank, world_size=world_size)
+
+class TemporalRunDataset(Dataset):
+    """
+    Training samples grouped into runs of consecutive frames.
+
+    Neighbouring samples share three of their four frames, which the plain
+    dataset decodes, preprocesses and warps again for every sample. Each item
+    here is a run of samples whose frames are decoded and spatially transformed
+    once, then gathered into every sample's 4-frame input; collate_runs() joins
+    runs into a batch. Frames are matched by their label timestamp, so runs
+    across gaps left by filtering simply share less.
+
+    The whole run shares one augmentation draw, so its samples stay consistent
+    with each other. Intensity normalization and blur still run per sample, as
+    in the plain dataset. Runs are sampled as units, so --hard-examples and
+    mid-epoch checkpoints don't apply (parse_args rejects them).
+
+    conv1 itself isn't shared: it is linear in its input channels, and every
+    (frame, channel slot) product feeds exactly one sample, so splitting it per
+    frame would do the same multiply-adds. The saving is decoding and warping.
+    """
+    def __init__(self, dataset, run_length, indices=None):
+        self.dataset = dataset
+        indices = list(indices) if indices is not None else list(range(len(dataset)))
+        self.runs = [indices[i:i + run_length] for i in range(0, len(indices), run_length)]
+
+    def __len__(self):
+        return len(self.runs)
+
+    def window(self, idx):
+        """A sample's frames in input channel order: the current frame, then its previous frames (None when missing)."""
+        frame = self.dataset.aligned_frames[idx]
+        return [frame] + list(frame[4])
+
+    def decoded_frames(self):
+        """Frames decoded per epoch, against four per sample without runs."""
+        return sum(len({f[3] if f is not None else None for idx in run for f in self.window(idx)}) for run in self.runs)
+
+    def __getitem__(self, r):
+        ds = self.dataset
+        plan = None
+        if TRAINING if ds.augment is None else ds.augment:
+            plan = ds.draw_augmentation()
+
+        slots, images, windows = {}, [], []
+        for idx in self.runs[r]:
+            window = []
+            for frame in self.window(idx):
+                key = frame[3] if frame is not None else None
+                if key not in slots:
+                    slots[key] = len(images)
+                    images.append(ds.stack_eyes(frame[1], frame[2]) if frame is not None else None)
+                window.append(slots[key])
+            windows.append(window)
+        # A missing previous frame is black, as in load_image; the current frame always exists
+        images = [image if image is not None else np.zeros_like(images[0]) for image in images]
+
+        # The run's spatial transform is the same for every frame, so it runs once per frame;
+        # intensity normalizes over a sample's whole input, so it and the blur after it run per sample
+        stack = ds.apply_augmentation(torch.from_numpy(np.concatenate(images, axis=0)).float(), plan, stages=("spatial",))
+        frames = stack.view(len(images), -1, stack.shape[-2], stack.shape[-1])
+        inputs = frames[torch.tensor(windows)].flatten(1, 2)
+        if ds.augments(plan):
+            inputs = torch.stack([ds.apply_augmentation(x, plan, stages=("intensity", "blur")) for x in inputs])
+        if ds.transform:
+            inputs = torch.stack([ds.transform(x) for x in inputs])
+
+        labels, states = zip(*(ds.load_label(idx) for idx in self.runs[r]))
+        return inputs.to(DEVICE), torch.from_numpy(np.stack(labels)).to(DEVICE), torch.tensor(states)
+
+def collate_runs(runs):
+    """Join TemporalRunDataset runs into one batch of samples."""
+    return torch.cat([r[0] for r in runs]), torch.cat([r[1] for r in runs]), torch.cat([r[2] for r in runs])
+
+def make_training_loader(dataset, args, hard_examples=True):
+    """
+    Training loader over dataset (or a Subset of it), in runs of consecutive
+    frames with --temporal-runs. Runs keep roughly --batch-size samples per batch.
+    """
+    if args.temporal_runs > 1:
+        base, indices = (dataset.dataset, dataset.indices) if isinstance(dataset, Subset) else (dataset, None)
+        runs = TemporalRunDataset(base, args.temporal_runs, indices)
+        samples = sum(len(run) for run in runs.runs)
+        print("Temporal runs of %d: %d frames decoded per epoch instead of %d" %
+              (args.temporal_runs, runs.decoded_frames(), samples * 4), flush=True)
+        return make_loader(runs, args, sampler=make_sampler(len(runs), args, hard_examples=False),
+                           batch_size=max(1, args.batch_size // args.temporal_runs), collate_fn=collate_runs)
+    return make_loader(dataset, args, sampler=make_sampler(len(dataset), args, hard_examples=hard_examples))
+
+def dataset_resolution(dataset):
+    """Side the eye images of dataset (or a Subset of it) are decoded at."""
+    base = dataset.dataset if isinstance(dataset, Subset) else dataset
+    return getattr(base, "resolution", None) or RESOLUTION
+
+def progressive_sizes(num_epochs, low, high, step=16):
+    """Per-epoch input sizes growing from low to high in multiples of step, reaching high in the last epoch."""
+    if num_epochs <= 1 or low >= high:
+        return [high] * num_epochs
+    return [int(round((low + (high - low) * e / (num_epochs - 1)) / step)) * step for e in range(num_epochs)]
+
+def train_calibration(model, dataset, args, epochs_aug, epochs_noaug, e_add=0, e_total=0, eye=None, checkpointer=None, resume=None):
+    """
+    Fine-tune with augmentations, then finish with clean (no augmentation) epochs.
+    With a checkpointer both phases are checkpointed under eye; resume is a loaded
+    checkpoint and picks up the phase it recorded for this eye. With
+    --progressive-resize the augmented epochs start at a lower resolution.
+    """
+    global TRAINING
+
+    stage = None
+    if resume is not None and resume['phase']['eye'] == eye:
+        stage = resume['phase']['stage']
+
+    if stage != 'clean':
+        val_loader = None
+        early_stopping = None
+        train_set = dataset
+        if args.early_stopping:
+            train_set, val_set = split_holdout(dataset, val_fraction=args.val_fraction)
+            val_loader = make_loader(val_set, args, shuffle=False)
+            early_stopping = EarlyStopping(patience=args.patience, min_delta=args.min_delta)
+
+        train_loader = make_training_loader(train_set, args)
+
+        model, epoch_losses, batch_losses = train_model(
+            model,
+            None,
+            train_loader,
+            num_epochs=epochs_aug,
+            lr=args.lr,
+            class_step=True,
+            e_add = e_add,
+            e_total = e_total,
+            precision=args.precision,
+            compile_mode=args.compile,
+            val_loader=val_loader,
+            eval_every=args.eval_every,
+            early_stopping=early_stopping,
+            checkpointer=checkpointer,
+            phase={'eye': eye, 'stage': 'aug'},
+            checkpoint_every=args.checkpoint_every,
+            resume_state=resume['state'] if stage == 'aug' else None,
+            qat_epochs=min(args.qat_epochs, epochs_aug),
+            resize_schedule=progressive_sizes(epochs_aug, args.progressive_min, dataset_resolution(dataset)) if args.progressive_resize else None
+        )
+
+        if early_stopping is not None:
+            stopped = early_stopping.stopped_epoch or (e_add + epochs_aug)
+            print("Augmented phase ran to epoch %d of %d, restored best weights from epoch %d (validation MSE %.6f)" %
+                  (stopped, e_add + epochs_aug, early_stopping.best_epoch, early_stopping.best), flush=True)
+
+        del train_loader
+
+    TRAINING = False # disable augs for 1 epoch
+
+    # The clean epoch always runs, on every frame including the held-out ones
+    train_loader = make_training_loader(dataset, args, hard_examples=False)
+
+    model, epoch_losses, batch_losses = train_model(
+        model,
+        None,
+        train_loader,
+        num_epochs=epochs_noaug,
+        lr=args.lr,
+        class_step=True,
+        e_add = e_add + epochs_aug,
+        e_total = e_total,
+        precision=args.precision,
+        compile_mode=args.compile,
+        checkpointer=checkpointer,
+        phase={'eye': eye, 'stage': 'clean'},
+        checkpoint_every=args.checkpoint_every,
+        resume_state=resume['state'] if stage == 'clean' else None,
+        qat_epochs=epochs_noaug if args.qat_epochs else 0
+    )
+
+    TRAINING = True
+
+    if checkpointer is not None:
+        checkpointer.mark_completed(eye, model)
+
+    return model
+
+EYE_NAMES = {'left': "left eye", 'right': "right eye", 'both': "both eyes"}
+
+def calibrate(model, dataset, args, eye, budget_s=0, e_add=0, e_total=0, checkpointer=None, resume=None):
+    """Fine-tune one eye (or both, for eye='both') with the mode selected on the command line."""
+    if 0 < args.coreset < 1:
+        dataset, _ = select_coreset(dataset, args, model)
+    if args.time_budget:
+        model, _ = train_for_budget(model, dataset, args, budget_s, EYE_NAMES[eye], lr=args.lr)
+        return model
+    if args.fast_calibration:
+        model, _ = fast_calibrate(model, dataset, args, EYE_NAMES[eye])
+        return model
+    if args.freeze_blocks:
+        return train_partial_freeze(model, dataset, args, args.freeze_blocks, EPOCHS_AUG, EPOCHS_NOAUG,
+                                    e_add=e_add, e_total=e_total)
+    if args.adapters:
+        total = count_parameters(model)
+        trainable = add_adapters(model, args.adapter_rank)
+        print("Adapter fine-tuning (rank %d): %d of %d parameters trainable" % (args.adapter_rank, trainable, total), flush=True)
+        model = train_calibration(model, dataset, args, EPOCHS_AUG, EPOCHS_NOAUG, e_add=e_add, e_total=e_total)
+        save_adapters(model, eye)
+        return merge_adapters(model)
+    return train_calibration(model, dataset, args, EPOCHS_AUG, EPOCHS_NOAUG, e_add=e_add, e_total=e_total,
+                             eye=eye, checkpointer=checkpointer, resume=resume)
+
+def backbone_features(model, inputs):
+    """Pooled backbone features; both towers' features side by side for a MultiChad."""
+    if isinstance(model, MultiChad):
+        return torch.cat([model.left(inputs[:, [0, 2, 4, 6]], return_blends=False),
+                          model.right(inputs[:, [1, 3, 5, 7]], return_blends=False)], dim=1)
+    return model(inputs, return_blends=False)
+
+def head_forward(model, features):
+    """Run the fc + sigmoid head(s) on features from backbone_features()."""
+    if isinstance(model, MultiChad):
+        n = model.left.fc.in_features
+        return torch.cat([model.left.sigmoid(model.left.fc(features[:, :n])),
+                          model.right.sigmoid(model.right.fc(features[:, n:]))], dim=1)
+    return model.sigmoid(model.fc(features))
+
+def head_parameters(model):
+    if isinstance(model, MultiChad):
+        return list(model.left.fc.parameters()) + list(model.right.fc.parameters())
+    return list(model.fc.parameters())
+
+def cache_backbone_features(model, dataset, args, variants=4):
+    """
+    Run every frame through the frozen backbone once without augmentation and
+    `variants` more times with augmentation, and keep the pooled features.
+
+    Returns:
+        tuple: (features, labels) as CPU tensors
+    """
+    clean_view = copy.copy(dataset)
+    clean_view.augment = False
+    aug_view = copy.copy(dataset)
+    aug_view.augment = True
+
+    features, labels = [], []
+    model.eval()
+    with torch.no_grad():
+        for view in [clean_view] + [aug_view] * variants:
+            for batch in make_loader(view, args, shuffle=False, batch_size=64):
+                features.append(backbone_features(model, batch[0].to(DEVICE)).cpu())
+                labels.append(batch[1].cpu())
+    model.train()
+    return torch.cat(features), torch.cat(labels)
+
+def train_head(model, features, labels, epochs=200, batch_size=256, lr=0.003, eta_min=1e-5):
+    """Train only the fc head(s) on cached backbone features."""
+    params = head_parameters(model)
+    optimizer = optim.AdamW(params, lr=lr)
+    scheduler = CosineAnnealingLR(optimizer, T_max=epochs, eta_min=eta_min)
+    criterion = nn.MSELoss()
+
+    features, labels = features.to(DEVICE), labels.to(DEVICE)
+    for epoch in range(epochs):
+        perm = torch.randperm(features.shape[0], device=features.device)
+        running_loss = 0.0
+        for i in range(0, features.shape[0], batch_size):
+            idx = perm[i:i + batch_size]
+            optimizer.zero_grad()
+            loss = calibration_loss(model, criterion, head_forward(model, features[idx]), labels[idx])
+            loss.backward()
+            optimizer.step()
+            running_loss += loss.item() * idx.shape[0]
+        scheduler.step()
+        if (epoch + 1) % 20 == 0 or epoch == epochs - 1:
+            print("Head epoch %d/%d, Loss: %.6f" % (epoch + 1, epochs, running_loss / features.shape[0]), flush=True)
+    return model
+
+def finetune_full(model, dataset, args, epochs, lr=1e-4, eta_min=1e-5):
+    """Short full fine-tune with cosine-decayed LR; the last epoch runs without augmentation."""
+    global TRAINING
+
+    criterion = nn.MSELoss()
+    optimizer = optim.AdamW(model.parameters(), lr=lr)
+    loader_len = len(make_loader(dataset, args))
+    scheduler = CosineAnnealingLR(optimizer, T_max=max(1, epochs * loader_len), eta_min=eta_min)
+
+    model.train()
+    for epoch in range(epochs):
+        TRAINING = epoch < epochs - 1
+        for i, (inputs, labels, _) in enumerate(make_loader(dataset, args, shuffle=True)):
+            inputs, labels = inputs.to(DEVICE), labels.to(DEVICE)
+            optimizer.zero_grad()
+            loss = calibration_loss(model, criterion, model(inputs), labels)
+            loss.backward()
+            optimizer.step()
+            scheduler.step()
+            print("\rFine-tune epoch %d/%d, Batch %u/%u, Loss: %.6f" % (epoch + 1, epochs, i, loader_len, float(loss)), flush=True)
+    TRAINING = True
+    return model
+
+def fast_calibrate(model, dataset, args, name):
+    """
+    Head-only calibration: cache backbone features once, train only fc on them,
+    then optionally run a short full fine-tune.
+
+    Returns:
+        tuple: (model, report) with the time spent in each stage
+    """
+    model = model.to(DEVICE)
+    start = time.time()
+    features, labels = cache_backbone_features(model, dataset, args, variants=args.head_aug_variants)
+    cached = time.time()
+    print("%s: cached %d feature vectors in %.1fs" % (name, features.shape[0], cached - start), flush=True)
+
+    train_head(model, features, labels, epochs=args.head_epochs)
+    head_done = time.time()
+
+    if args.head_finetune_epochs > 0:
+        finetune_full(model, dataset, args, args.head_finetune_epochs)
+    end = time.time()
+
+    report = {'cache_s': cached - start, 'head_s': head_done - cached, 'finetune_s': end - head_done, 'total_s': end - start}
+    print("Fast calibration (%s): features %.1fs, head %.1fs, fine-tune %.1fs, total %.1fs" %
+          (name, report['cache_s'], report['head_s'], report['finetune_s'], report['total_s']), flush=True)
+    return model, report
+
+def set_frozen_blocks(model, k):
+    """Freeze the first k conv blocks of every tower (k=0 unfreezes everything)."""
+    towers = [model.left, model.right] if isinstance(model, MultiChad) else [model]
+    for tower in towers:
+        for i in range(tower.depth):
+            for p in getattr(tower, "conv%d" % (i + 1)).parameters():
+                p.requires_grad = i >= k
+
+def prefix_forward(model, inputs, k):
+    """Output of the first k blocks; the two towers are stacked along channels for a MultiChad."""
+    if isinstance(model, MultiChad):
+        return torch.cat([model.left.forward_blocks(inputs[:, [0, 2, 4, 6]], 0, k),
+                          model.right.forward_blocks(inputs[:, [1, 3, 5, 7]], 0, k)], dim=1)
+    return model.forward_blocks(inputs, 0, k)
+
+class StartAtBlock(nn.Module):
+    """Runs a model from block k onwards, for inputs that are already prefix activations."""
+    def __init__(self, model, k):
+        super(StartAtBlock, self).__init__()
+        self.model = model
+        self.k = k
+
+    def forward(self, x, return_blends=True):
+        if isinstance(self.model, MultiChad):
+            half = x.shape[1] // 2
+            return torch.cat([self.model.left(x[:, :half], start_block=self.k),
+                              self.model.right(x[:, half:], start_block=self.k)], dim=-1)
+        return self.model(x, return_blends=return_blends, start_block=self.k)
+
+class PrefixCacheDataset(Dataset):
+    """
+    Sample source for partial-freeze training.
+
+    Clean (un-augmented) samples whose frozen-prefix activations are already cached
+    skip decoding entirely; everything else is decoded, augmented if drawn, and
+    handed to collate_prefix() to run the frozen blocks.
+    """
+    def __init__(self, dataset, cache, indices=None):
+        self.dataset = dataset
+        self.cache = cache
+        self.indices = list(indices) if indices is not None else list(range(len(dataset)))
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        idx = self.indices[i]
+        ds = self.dataset
+        plan = None
+        if TRAINING if ds.augment is None else ds.augment:
+            plan = ds.draw_augmentation()
+        clean = not ds.augments(plan)
+
+        label, is_safe_frame = ds.load_label(idx)
+        label = torch.from_numpy(label)
+        if clean and idx in self.cache:
+            return None, self.cache[idx], label, idx
+
+        image = ds.apply_augmentation(ds.load_image(idx), plan)
+        return image, None, label, idx if clean else None
+
+class ActivationCache(dict):
+    """
+    Frozen-prefix activations by frame index, up to a memory cap. They are kept
+    in the dtype the frozen blocks produced, so a cached sample trains on exactly
+    the values recomputing it would give.
+    """
+    def __init__(self, max_mb=512):
+        super(ActivationCache, self).__init__()
+        self.max_bytes = max_mb * 1024 * 1024
+        self.bytes = 0
+
+    def add(self, idx, activation):
+        size = activation.numel() * activation.element_size()
+        if self.bytes + size <= self.max_bytes:
+            self[idx] = activation.detach().to("cpu")
+            self.bytes += size
+
+def collate_prefix(samples, model, k, cache):
+    """
+    Batch PrefixCacheDataset samples into prefix activations: decoded images go through
+    the frozen blocks without autograd, cached activations are reused as they are.
+    """
+    images = [sample[0] for sample in samples if sample[0] is not None]
+    computed = []
+    if images:
+        with torch.no_grad():
+            computed = list(prefix_forward(model, torch.stack(images).to(DEVICE), k))
+
+    acts = []
+    for image, cached, label, cache_idx in samples:
+        if image is None:
+            acts.append(cached.to(DEVICE))
+            continue
+        act = computed.pop(0)
+        if cache_idx is not None:
+            cache.add(cache_idx, act)
+        acts.append(act)
+
+    labels = torch.stack([sample[2] for sample in samples]).to(DEVICE)
+    return torch.stack(acts), labels, torch.zeros(len(samples), dtype=torch.bool)
+
+def train_partial_freeze(model, dataset, args, k, epochs_aug, epochs_noaug, e_add=0, e_total=0, indices=None, history=None):
+    """
+    Fine-tune with the first k conv blocks frozen.
+
+    Frozen blocks never see a backward pass. Clean samples reuse cached prefix
+    activations after their first visit, so they skip decoding and the frozen
+    forward too; only augmented samples recompute them.
+    """
+    global TRAINING
+
+    if k <= 0:
+        train_set = Subset(dataset, indices) if indices is not None else dataset
+        model, _, _ = train_model(model, None, make_loader(train_set, args, sampler=EpochSampler(len(train_set))),
+                                  num_epochs=epochs_aug, lr=args.lr, class_step=True, e_add=e_add, e_total=e_total,
+                                  precision=args.precision, history=history)
+        TRAINING = False
+        model, _, _ = train_model(model, None, make_loader(train_set, args, sampler=EpochSampler(len(train_set))),
+                                  num_epochs=epochs_noaug, lr=args.lr, class_step=True, e_add=e_add + epochs_aug, e_total=e_total,
+                                  precision=args.precision, history=history)
+        TRAINING = True
+        return model
+
+    model = model.to(DEVICE)
+    set_frozen_blocks(model, k)
+    cache = ActivationCache(args.freeze_cache_mb)
+    samples = PrefixCacheDataset(dataset, cache, indices)
+    collate = lambda batch: collate_prefix(batch, model, k, cache)
+    suffix = StartAtBlock(model, k)
+
+    suffix, _, _ = train_model(suffix, None, make_loader(samples, args, sampler=EpochSampler(len(samples)), collate_fn=collate),
+                               num_epochs=epochs_aug, lr=args.lr, class_step=True, e_add=e_add, e_total=e_total,
+                               precision=args.precision, history=history)
+
+    TRAINING = False # disable augs for 1 epoch
+
+    suffix, _, _ = train_model(suffix, None, make_loader(samples, args, sampler=EpochSampler(len(samples)), collate_fn=collate),
+                               num_epochs=epochs_noaug, lr=args.lr, class_step=True, e_add=e_add + epochs_aug, e_total=e_total,
+                               precision=args.precision, history=history)
+
+    TRAINING = True
+
+    print("Partial freeze (k=%d): %d activations cached (%.1f MB)" % (k, len(cache), cache.bytes / 1024 / 1024), flush=True)
+    set_frozen_blocks(model, 0)
+    return model
+
+def sweep_frozen_blocks(args):
+    """Report time per epoch and held-out error for each number of frozen blocks."""
+    side = 'both' if args.joint else 'left'
+    dataset = load_capture_dataset(args.capture, side)
+    train_set, val_set = split_holdout(dataset, val_fraction=args.val_fraction)
+    val_loader = make_loader(val_set, args, shuffle=False)
+
+    results = []
+    for k in args.sweep_freeze:
+        torch.manual_seed(42)
+        np.random.seed(42)
+        history = []
+        model = train_partial_freeze(load_baseline(side), dataset, args, k, EPOCHS_AUG, EPOCHS_NOAUG,
+                                     e_total=EPOCHS_AUG + EPOCHS_NOAUG - 1, indices=train_set.indices, history=history)
+        results.append((k, history, evaluate_model(model, val_loader)))
+
+    print("\n=== Frozen block sweep (%d train / %d held-out frames) ===\n" % (len(train_set), len(val_set)), flush=True)
+    for k, history, metrics in results:
+        # The first epoch fills the activation cache, later epochs show the steady state
+        steady = [h['seconds'] for h in history[1:]] or [history[0]['seconds']]
+        print("k=%d: first epoch %.2fs, later epochs %.2fs avg, MSE %.6f, gaze error %.3f deg" %
+              (k, history[0]['seconds'], np.mean(steady), metrics['mse'], metrics['gaze_error_deg']), flush=True)
+
+class AdaptedConv2d(nn.Module):
+    """
+    Frozen convolution plus a trainable low-rank delta and per-channel scale/shift:
+
+        y = scale * (conv(x) + up(down(x))) + shift
+
+    down is a rank-r convolution with the original kernel, up a 1x1 projection
+    initialised to zero, so training starts from exactly the baseline output.
+    merged() folds everything back into one plain nn.Conv2d.
+    """
+    def __init__(self, conv, rank=4):
+        super(AdaptedConv2d, self).__init__()
+        self.conv = conv
+        for p in self.conv.parameters():
+            p.requires_grad = False
+
+        self.rank = rank
+        if rank > 0:
+            self.down = nn.Conv2d(conv.in_channels, rank, kernel_size=conv.kernel_size, stride=conv.stride,
+                                  padding=conv.padding, bias=False)
+            self.up = nn.Conv2d(rank, conv.out_channels, kernel_size=1, bias=False)
+            nn.init.zeros_(self.up.weight)
+        self.scale = nn.Parameter(torch.ones(conv.out_channels))
+        self.shift = nn.Parameter(torch.zeros(conv.out_channels))
+
+    def forward(self, x):
+        y = self.conv(x)
+        if self.rank > 0:
+            y = y + self.up(self.down(x))
+        return y * self.scale.view(1, -1, 1, 1) + self.shift.view(1, -1, 1, 1)
+
+    def merged(self):
+        weight = self.conv.weight.detach()
+        if self.rank > 0:
+            weight = weight + torch.einsum('or,rikl->oikl', self.up.weight.detach()[:, :, 0, 0], self.down.weight.detach())
+        conv = nn.Conv2d(self.conv.in_channels, self.conv.out_channels, kernel_size=self.conv.kernel_size,
+                         stride=self.conv.stride, padding=self.conv.padding)
+        with torch.no_grad():
+            conv.weight.copy_(weight * self.scale.detach().view(-1, 1, 1, 1))
+            conv.bias.copy_(self.conv.bias.detach() * self.scale.detach() + self.shift.detach())
+        return conv.to(weight.device)
+
+class AdaptedLinear(nn.Module):
+    """Linear counterpart of AdaptedConv2d, used for the fc head."""
+    def __init__(self, linear, rank=4):
+        super(AdaptedLinear, self).__init__()
+        self.linear = linear
+        for p in self.linear.parameters():
+            p.requires_grad = False
+
+        self.rank = rank
+        if rank > 0:
+            self.down = nn.Linear(linear.in_features, rank, bias=False)
+            self.up = nn.Linear(rank, linear.out_features, bias=False)
+            nn.init.zeros_(self.up.weight)
+        self.scale = nn.Parameter(torch.ones(linear.out_features))
+        self.shift = nn.Parameter(torch.zeros(linear.out_features))
+
+    def forward(self, x):
+        y = self.linear(x)
+        if self.rank > 0:
+            y = y + self.up(self.down(x))
+        return y * self.scale + self.shift
+
+    def merged(self):
+        weight = self.linear.weight.detach()
+        if self.rank > 0:
+            weight = weight + self.up.weight.detach() @ self.down.weight.detach()
+        linear = nn.Linear(self.linear.in_features, self.linear.out_features)
+        with torch.no_grad():
+            linear.weight.copy_(weight * self.scale.detach().view(-1, 1))
+            linear.bias.copy_(self.linear.bias.detach() * self.scale.detach() + self.shift.detach())
+        return linear.to(weight.device)
+
+def adapted_layers(tower):
+    """Names of a tower's conv layers and fc head, the layers adapters and fake quantization wrap."""
+    return ["conv%d" % (i + 1) for i in range(tower.depth)] + ["fc"]
+
+def model_towers(model):
+    return [model.left, model.right] if isinstance(model, MultiChad) else [model]
+
+def add_adapters(model, rank=4):
+    """
+    Wrap every conv layer and the fc head of each tower with adapters and freeze
+    the baseline weights. Returns the number of trainable parameters.
+    """
+    for tower in model_towers(model):
+        for name in adapted_layers(tower):
+            layer = getattr(tower, name)
+            wrapped = AdaptedLinear(layer, rank) if isinstance(layer, nn.Linear) else AdaptedConv2d(layer, rank)
+            setattr(tower, name, wrapped.to(layer.weight.device))
+    return sum(p.numel() for p in model.parameters() if p.requires_grad)
+
+def merge_adapters(model):
+    """Fold the adapters back into plain layers so the state dict and ONNX graph match the baseline model."""
+    for tower in model_towers(model):
+        for name in adapted_layers(tower):
+            layer = getattr(tower, name)
+            if isinstance(layer, (AdaptedConv2d, AdaptedLinear)):
+                setattr(tower, name, layer.merged())
+    for p in model.parameters():
+        p.requires_grad = True
+    return model
+
+def save_adapters(model, eye):
+    """Write only the adapter weights, one small file per eye."""
+    if not is_main_process():
+        return
+    towers = {'left': model.left, 'right': model.right} if isinstance(model, MultiChad) else {eye: model}
+    for side, tower in towers.items():
+        state = {k: v for k, v in tower.state_dict().items()
+                 if not (k.endswith(".conv.weight") or k.endswith(".conv.bias") or ".linear." in k)}
+        path = "%s_adapter.pth" % side
+        torch.save(state, path)
+        print("Saved %d adapter tensors (%d parameters) to %s" %
+              (len(state), sum(v.numel() for v in state.values()), path), flush=True)
+
+def activation_fake_quant():
+    """uint8 per-tensor fake quantization, as ONNX Runtime quantizes activations."""
+    return FakeQuantize(observer=MovingAverageMinMaxObserver, quant_min=0, quant_max=255,
+                        dtype=torch.quint8, qscheme=torch.per_tensor_affine)
+
+def weight_fake_quant():
+    """int8 per-output-channel symmetric fake quantization, as ONNX Runtime quantizes weights."""
+    return FakeQuantize(observer=MovingAveragePerChannelMinMaxObserver, quant_min=-128, quant_max=127,
+                        dtype=torch.qint8, qscheme=torch.per_channel_symmetric, ch_axis=0)
+
+class QuantConv2d(nn.Module):
+    """
+    Convolution with fake-quantized weights and output for quantization-aware training.
+
+    Every MicroChad conv is followed by ReLU, so the ReLU is applied here, before
+    the output is fake-quantized, and the tower's own activation is switched off
+    while wrapped. That matches ONNX Runtime folding the ReLU into the quantized
+    conv. The first conv also fake-quantizes its input.
+    """
+    def __init__(self, conv, quantize_input=False):
+        super(QuantConv2d, self).__init__()
+        self.conv = conv
+        self.input_fq = activation_fake_quant() if quantize_input else None
+        self.weight_fq = weight_fake_quant()
+        self.output_fq = activation_fake_quant()
+
+    def forward(self, x):
+        if self.input_fq is not None:
+            x = self.input_fq(x)
+        c = self.conv
+        y = F.conv2d(x, self.weight_fq(c.weight), c.bias, c.stride, c.padding, c.dilation, c.groups)
+        return self.output_fq(F.relu(y))
+
+class QuantLinear(nn.Module):
+    """Linear counterpart of QuantConv2d for the fc head (no ReLU follows it)."""
+    def __init__(self, linear):
+        super(QuantLinear, self).__init__()
+        self.linear = linear
+        self.weight_fq = weight_fake_quant()
+        self.output_fq = activation_fake_quant()
+
+    def forward(self, x):
+        return self.output_fq(F.linear(x, self.weight_fq(self.linear.weight), self.linear.bias))
+
+def is_fake_quantized(model):
+    return any(isinstance(m, (QuantConv2d, QuantLinear)) for m in model.modules())
+
+def add_fake_quant(model):
+    """
+    Wrap every conv layer and the fc head of each tower for quantization-aware
+    training. The wrappers share the original parameters, so an optimizer built
+    before the call keeps training them.
+    """
+    if is_fake_quantized(model):
+        return model
+    for tower in model_towers(model):
+        if any(type(getattr(tower, name)) not in (nn.Conv2d, nn.Linear) for name in adapted_layers(tower)):
+            print("Quantization-aware training needs plain conv/linear layers, skipping it", flush=True)
+            return model
+    for tower in model_towers(model):
+        device = tower.fc.weight.device
+        for name in adapted_layers(tower):
+            layer = getattr(tower, name)
+            wrapped = QuantLinear(layer) if isinstance(layer, nn.Linear) else QuantConv2d(layer, quantize_input=name == "conv1")
+            setattr(tower, name, wrapped.to(device))
+        tower.act = nn.Identity()
+    return model
+
+def remove_fake_quant(model):
+    """Unwrap the fake-quantized layers, leaving the trained fp32 weights in plain layers."""
+    for tower in model_towers(model):
+        for name in adapted_layers(tower):
+            layer = getattr(tower, name)
+            if isinstance(layer, QuantConv2d):
+                setattr(tower, name, layer.conv)
+            elif isinstance(layer, QuantLinear):
+                setattr(tower, name, layer.linear)
+        tower.act = nn.ReLU(inplace=True)
+    return model
+
+def load_training_state(model, state):
+    """load_state_dict that first adds fake quantization when state comes from a quantization-aware model."""
+    if any(k.endswith("weight_fq.scale") for k in state):
+        add_fake_quant(model)
+    model.load_state_dict(state)
+
+def export_qdq(model, path):
+    """
+    Export a fake-quantized MultiChad as a QDQ ONNX model, which ONNX Runtime runs
+    with INT8 kernels, using the ranges the observers learned during training.
+    """
+    model = copy.deepcopy(model).to("cpu").eval()
+    model.apply(disable_observer)
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # Only the TorchScript exporter turns fake quantization into QuantizeLinear/DequantizeLinear
+        kwargs["dynamo"] = False
+    torch.onnx.export(
+        model,
+        torch.rand(1, 8, RESOLUTION, RESOLUTION),
+        path,
+        export_params=True,
+        opset_version=15,
+        do_constant_folding=True,
+        input_names=['input'],
+        output_names=['output'],
+        dynamic_axes={
+            'input': {0: 'batch_size'},
+            'output': {0: 'batch_size'}
+        },
+        **kwargs
+    )
+    fold_weight_quantization(path)
+
+def fold_weight_quantization(path):
+    """
+    Store the weights of a QDQ model as int8: every QuantizeLinear applied to a
+    constant weight is evaluated once and replaced by its int8 result, instead of
+    shipping fp32 weights that are quantized on every session load.
+    """
+    model = onnx.load(path)
+    graph = model.graph
+    inits = {i.name: i for i in graph.initializer}
+    identity = {n.output[0]: n.input[0] for n in graph.node if n.op_type == "Identity"}
+
+    def constant(name):
+        name = identity.get(name, name)
+        return onnx.numpy_helper.to_array(inits[name]) if name in inits else None
+
+    folded = []
+    for node in graph.node:
+        if node.op_type != "QuantizeLinear" or node.input[0] not in inits or len(node.input) < 3:
+            continue
+        weight, scale, zero_point = (constant(name) for name in node.input)
+        if scale is None or zero_point is None:
+            continue
+        axis = next((a.i for a in node.attribute if a.name == "axis"), 1)
+        shape = [1] * weight.ndim
+        if scale.ndim:
+            shape[axis] = -1
+        # np.rint rounds half to even, like QuantizeLinear
+        q = np.rint(weight / scale.reshape(shape)) + zero_point.reshape(shape).astype(np.int32)
+        info = np.iinfo(zero_point.dtype)
+        graph.initializer.append(onnx.numpy_helper.from_array(np.clip(q, info.min, info.max).astype(zero_point.dtype), node.output[0]))
+        folded.append(node)
+    for node in folded:
+        graph.node.remove(node)
+
+    # Drop what only fed the folded nodes: Identity nodes first, then the fp32 weights
+    used = {i for n in graph.node for i in n.input} | {o.name for o in graph.output}
+    for node in [n for n in graph.node if n.op_type == "Identity" and n.output[0] not in used]:
+        graph.node.remove(node)
+    used = {i for n in graph.node for i in n.input} | {o.name for o in graph.output}
+    keep = [i for i in graph.initializer if i.name in used]
+    del graph.initializer[:]
+    graph.initializer.extend(keep)
+    onnx.save(model, path)
+
+def frames_view(dataset, indices):
+    """Shallow copy of a CaptureDataset that only holds the given aligned frames."""
+    view = copy.copy(dataset)
+    view.aligned_frames = [dataset.aligned_frames[i] for i in indices]
+    return view
+
+def coreset_embeddings(dataset, args, model=None, size=16):
+    """
+    One cheap embedding per frame: the current frame downsampled to size x size,
+    or the model's pooled backbone features when a model is given.
+    """
+    if model is not None:
+        features, _ = cache_backbone_features(model, dataset, args, variants=0)
+        return features.numpy().astype(np.float32)
+
+    def embed(idx):
+        label_data, left_eye_jpeg, right_eye_jpeg = dataset.aligned_frames[idx][:3]
+        current = dataset.stack_eyes(left_eye_jpeg, right_eye_jpeg)
+        return np.concatenate([cv2.resize(c, (size, size), interpolation=cv2.INTER_AREA).ravel() for c in current])
+
+    with ThreadPoolExecutor(max_workers=max(1, args.loader_workers or torch.get_num_threads())) as pool:
+        return np.stack(list(pool.map(embed, range(len(dataset)))))
+
+def k_center_greedy(points, k, seed=0, chunk_size=4096):
+    """
+    Farthest-point selection: every pick is the point furthest from everything
+    picked so far, so dense runs of near-identical frames collapse to a few
+    representatives while isolated ones are always kept. Selection stops early
+    once every remaining point duplicates a picked one, so fewer than k indices
+    can come back. Distances are computed chunk_size points at a time to bound
+    the temporary memory on long captures.
+    """
+    def distances(center):
+        out = np.empty(len(points), dtype=np.float64)
+        for start in range(0, len(points), chunk_size):
+            out[start:start + chunk_size] = ((points[start:start + chunk_size] - center) ** 2).sum(axis=1)
+        return out
+
+    rng = np.random.RandomState(seed)
+    selected = [rng.randint(len(points))]
+    dist = distances(points[selected[0]])
+    dist[selected[0]] = -np.inf
+    for _ in range(min(k, len(points)) - 1):
+        i = int(dist.argmax())
+        if dist[i] <= 0:
+            break
+        selected.append(i)
+        dist = np.minimum(dist, distances(points[i]))
+        dist[i] = -np.inf
+    return sorted(selected)
+
+def select_coreset(dataset, args, model=None):
+    """
+    Keep args.coreset of the aligned frames, chosen to cover both image space and
+    label space.
+
+    Args:
+        dataset: CaptureDataset to select from
+        args: parsed arguments (coreset, coreset_embedding, coreset_label_weight)
+        model: model whose backbone embeds frames for coreset_embedding='features'
+
+    Returns:
+        tuple: (view, indices) with view a CaptureDataset holding the selected frames
+    """
+    start = time.time()
+    n = len(dataset)
+    k = max(1, int(round(n * args.coreset)))
+
+    embeddings = coreset_embeddings(dataset, args, model if args.coreset_embedding == 'features' else None)
+    labels = np.stack([dataset.load_label(i)[0] for i in range(n)])
+
+    # Standardize each part and scale it by 1/sqrt(dim) so image and label space
+    # weigh the same regardless of how many dimensions each has
+    parts = []
+    for part, weight in ((embeddings, 1.0), (labels, args.coreset_label_weight)):
+        part = (part - part.mean(axis=0)) / (part.std(axis=0) + 1e-6)
+        parts.append(part * (weight / np.sqrt(part.shape[1])))
+    indices = k_center_greedy(np.concatenate(parts, axis=1).astype(np.float32), k)
+
+    print("Coreset: kept %d of %d frames (%s embedding) in %.1fs" %
+          (len(indices), n, args.coreset_embedding, time.time() - start), flush=True)
+    return frames_view(dataset, indices), indices
+
+def compare_fast_calibration(args):
+    """
+    Compare head-only, head-only + short fine-tune and full fine-tuning on the
+    same held-out split, reporting wall time and validation error for each.
+    """
+    side = 'both' if args.joint else 'left'
+    dataset = load_capture_dataset(args.capture, side)
+    train_set, val_set = split_holdout(dataset, val_fraction=args.val_fraction)
+    val_loader = make_loader(val_set, args, shuffle=False)
+
+    results = []
+    for label, finetune_epochs in (("head only", 0), ("head + fine-tune", max(1, args.head_finetune_epochs))):
+        torch.manual_seed(42)
+        np.random.seed(42)
+        args.head_finetune_epochs, saved = finetune_epochs, args.head_finetune_epochs
+        start = time.time()
+        model, _ = fast_calibrate(load_baseline(side), train_set, args, label)
+        results.append((label, time.time() - start, evaluate_model(model, val_loader)))
+        args.head_finetune_epochs = saved
+
+    torch.manual_seed(42)
+    np.random.seed(42)
+    start = time.time()
+    model = train_calibration(load_baseline(side), train_set, args, EPOCHS_AUG, EPOCHS_NOAUG, e_total=EPOCHS_AUG + EPOCHS_NOAUG - 1)
+    results.append(("full fine-tune", time.time() - start, evaluate_model(model, val_loader)))
+
+    results.append(("baseline", 0.0, evaluate_model(load_baseline(side), val_loader)))
+
+    print("\n=== Fast calibration comparison (%d train / %d held-out frames) ===\n" % (len(train_set), len(val_set)), flush=True)
+    for label, seconds, metrics in results:
+        print("%-17s %7.1fs  MSE %.6f  gaze error %.3f deg" % (label, seconds, metrics['mse'], metrics['gaze_error_deg']), flush=True)
+
+def epochs_to_target(history, target_deg):
+    """(epoch, cumulative seconds) when validation gaze error first reached target_deg, or (None, None)."""
+    seconds = 0.0
+    for h in history:
+        seconds += h['seconds']
+        if h['val_gaze_error_deg'] is not None and h['val_gaze_error_deg'] <= target_deg:
+            return h['epoch'], seconds
+    return None, None
+
+def compare_coreset(args):
+    """
+    Train on the full training split and on a coreset of it, validating after
+    every epoch, and report epochs and wall time to reach the target error.
+    """
+    side = 'both' if args.joint else 'left'
+    dataset = load_capture_dataset(args.capture, side)
+    train_set, val_set = split_holdout(dataset, val_fraction=args.val_fraction)
+    val_loader = make_loader(val_set, args, shuffle=False)
+    full = frames_view(dataset, train_set.indices)
+
+    runs = []
+    for label in ("full set", "coreset %.0f%%" % (args.coreset * 100)):
+        torch.manual_seed(42)
+        np.random.seed(42)
+        model = load_baseline(side)
+        start = time.time()
+        train_set = full
+        if label != "full set":
+            train_set, _ = select_coreset(full, args, model)
+        select_s = time.time() - start
+
+        history = []
+        train_model(model, None, make_loader(train_set, args, sampler=EpochSampler(len(train_set))),
+                    num_epochs=args.compare_epochs, lr=args.lr, class_step=True, e_total=args.compare_epochs - 1,
+                    precision=args.precision, compile_mode=args.compile, history=history,
+                    val_loader=val_loader, early_stopping=EarlyStopping(patience=None))
+        runs.append((label, len(train_set), select_s, history, time.time() - start))
+
+    # Unless given, the target is the full set's best error with 5% slack
+    target = args.coreset_target_deg or min(h['val_gaze_error_deg'] for h in runs[0][3]) * 1.05
+
+    print("\n=== Coreset comparison (%d held-out frames, target %.3f deg) ===\n" % (len(val_set), target), flush=True)
+    for label, frames, select_s, history, total_s in runs:
+        epoch, seconds = epochs_to_target(history, target)
+        reached = "target at epoch %d after %.1fs" % (epoch, seconds + select_s) if epoch else "target not reached"
+        print("%-13s %5d frames  selection %.1fs  total %.1fs  best %.3f deg  %s" %
+              (label, frames, select_s, total_s, min(h['val_gaze_error_deg'] for h in history), reached), flush=True)
+
+def compare_samplers(args):
+    """
+    Uniform sampling against loss-aware sampling, at the full epoch length and at
+    --hard-epoch-fraction of it, on the same held-out split.
+    """
+    side = 'both' if args.joint else 'left'
+    dataset = load_capture_dataset(args.capture, side)
+    train_set, val_set = split_holdout(dataset, val_fraction=args.val_fraction)
+    val_loader = make_loader(val_set, args, shuffle=False)
+
+    runs = [("uniform", EpochSampler(len(train_set)))]
+    runs.append(("loss-aware", LossAwareSampler(len(train_set), floor=args.hard_floor)))
+    if args.hard_epoch_fraction < 1:
+        runs.append(("loss-aware %.0f%%" % (args.hard_epoch_fraction * 100),
+                     LossAwareSampler(len(train_set), epoch_fraction=args.hard_epoch_fraction, floor=args.hard_floor)))
+
+    results = []
+    for label, sampler in runs:
+        torch.manual_seed(42)
+        np.random.seed(42)
+        history = []
+        start = time.time()
+        train_loader = make_loader(train_set, args, sampler=sampler)
+        model, _, _ = train_model(load_baseline(side), None, train_loader,
+                                  num_epochs=args.compare_epochs, lr=args.lr, class_step=True, e_total=args.compare_epochs - 1,
+                                  precision=args.precision, compile_mode=args.compile, history=history,
+                                  val_loader=val_loader, early_stopping=EarlyStopping(patience=None))
+        results.append((label, len(train_loader) * args.compare_epochs, time.time() - start, history))
+
+    print("\n=== Sampler comparison (%d train / %d held-out frames, %d epochs) ===\n" %
+          (len(train_set), len(val_set), args.compare_epochs), flush=True)
+    for label, steps, seconds, history in results:
+        print("%-17s %5d steps %7.1fs  final %.3f deg  best %.3f deg" %
+              (label, steps, seconds, history[-1]['val_gaze_error_deg'],
+               min(h['val_gaze_error_deg'] for h in history)), flush=True)
+
+def scaling_probe(args):
+    """
+    Timed training run used by benchmark_scaling(), launched with torchrun on
+    every rank. Rank 0 appends the aggregate throughput to --scaling-report.
+    """
+    rank, world_size = distributed_world()
+    side = 'both' if args.joint else 'left'
+    dataset = load_capture_dataset(args.capture, side, args.corpus)
+
+    history = []
+    train_model(load_baseline(side), None, make_loader(dataset, args, sampler=make_sampler(len(dataset), args, hard_examples=False)),
+                num_epochs=args.compare_epochs, lr=args.lr, class_step=True, e_total=args.compare_epochs - 1,
+                precision=args.precision, compile_mode=args.compile, history=history)
+
+    # The first epoch pays for start-up, later epochs are the steady state
+    steady = history[1:] or history
+    totals = torch.tensor([sum(h['samples_per_sec'] * h['seconds'] for h in steady)], dtype=torch.float64)
+    seconds = torch.tensor([sum(h['seconds'] for h in steady)], dtype=torch.float64)
+    if world_size > 1:
+        dist.all_reduce(totals, op=dist.ReduceOp.SUM)
+        dist.all_reduce(seconds, op=dist.ReduceOp.MAX)
+
+    if rank == 0:
+        entry = {'world_size': world_size, 'hosts': int(os.environ.get("GROUP_WORLD_SIZE", 1)),
+                 'samples_per_sec': float(totals / seconds), 'epoch_seconds': float(seconds) / len(steady)}
+        with open(args.scaling_report, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        print_scaling_report(args.scaling_report)
+
+def print_scaling_report(path):
+    """Throughput and efficiency of every world size recorded in path, relative to the smallest one."""
+    with open(path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    entries.sort(key=lambda e: e['world_size'])
+    base = entries[0]
+    per_rank = base['samples_per_sec'] / base['world_size']
+
+    print("\n=== Data-parallel scaling ===\n", flush=True)
+    for e in entries:
+        speedup = e['samples_per_sec'] / base['samples_per_sec']
+        efficiency = e['samples_per_sec'] / (per_rank * e['world_size'])
+        print("%3d ranks (%d host%s): %8.1f samples/s, epoch %.2fs, speedup %.2fx, efficiency %.0f%%" %
+              (e['world_size'], e['hosts'], "" if e['hosts'] == 1 else "s", e['samples_per_sec'], e['epoch_seconds'],
+               speedup, efficiency * 100), flush=True)
+
+def benchmark_scaling(args):
+    """
+    Run scaling_probe() with torchrun on 1, 2, 4, ... up to --benchmark-scaling
+    local ranks and report scaling efficiency. For several hosts, launch the probe
+    with torchrun on each host using --distributed --scaling-probe and a shared
+    --scaling-report instead.
+    """
+    if getattr(sys, "frozen", False):
+        # torchrun relaunches this file with a Python interpreter, which the packaged trainer doesn't ship
+        sys.exit("--benchmark-scaling relaunches trainermin.py with torchrun and can't run from the packaged trainer; run the script with Python instead")
+
+    counts = sorted({1, args.benchmark_scaling} | {2 ** i for i in range(1, 8) if 2 ** i < args.benchmark_scaling})
+    open(args.scaling_report, "w").close()
+
+    passthrough = ["--precision", args.precision, "--compile", args.compile, "--batch-size", str(args.batch_size),
+                   "--lr-scaling", args.lr_scaling, "--compare-epochs", str(args.compare_epochs)]
+    if args.joint:
+        passthrough.append("--joint")
+    if args.corpus:
+        passthrough += ["--corpus"] + args.corpus
+
+    for n in counts:
+        print("Scaling benchmark: %d rank%s" % (n, "" if n == 1 else "s"), flush=True)
+        subprocess.run([sys.executable, "-m", "torch.distributed.run", "--standalone", "--nproc_per_node=%d" % n,
+                        os.path.abspath(__file__), args.capture, args.output, "--distributed", "--scaling-probe",
+                        "--scaling-report", args.scaling_report] + passthrough, check=True)
+
+def export_onnx(model, path, dynamic_batch=True, size=None):
+    """Export a model taking the interleaved 8-channel input, with the input/output names the app expects."""
+    device = torch.device("cpu")
+    model = model.to(device).eval()
+
+    size = size or RESOLUTION
+    dummy_input = torch.randn(1, 8, size, size, device=device)  # Updated to 8 channels
+    torch.onnx.export(
+        model,
+        dummy_input,
+        path,
+        export_params=True,
+        opset_version=15,
+        do_constant_folding=True,
+        input_names=['input'],
+        output_names=['output'],
+        dynamic_axes={
+            'input': {0: 'batch_size'},
+            'output': {0: 'batch_size'}
+        } if dynamic_batch else None
+    )
+
+    # Newer exporters can put the weights in a side file; keep a single self-contained model
+    data_path = path + ".data"
+    if os.path.exists(data_path):
+        onnx.save(onnx.load(path), path)
+        os.remove(data_path)
+
+def fuse_for_export(multi, first_layer="gather", tolerance=1e-4):
+    """
+    FusedMultiChad for multi, checked against it on random input; multi itself
+    if the outputs don't match.
+    """
+    multi = multi.to("cpu").eval()
+    fused = FusedMultiChad(multi, first_layer).eval()
+    example = torch.rand(4, 8, RESOLUTION, RESOLUTION)
+    with torch.no_grad():
+        diff = (fused(example) - multi(example)).abs().max().item()
+    if diff > tolerance:
+        print("Fused export differs from MultiChad by %.2e, exporting the unfused model" % diff, flush=True)
+        return multi
+    print("Fused export matches MultiChad (max difference %.2e)" % diff, flush=True)
+    return fused
+
+def onnx_latency(path, example, runs=200, warmup=20):
+    """
+    ONNX Runtime latency of one input on the CPU provider.
+
+    Returns:
+        tuple: (median ms, 90th percentile ms, outputs)
+    """
+    session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+    feed = {session.get_inputs()[0].name: example}
+    for _ in range(warmup):
+        outputs = session.run(None, feed)[0]
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        session.run(None, feed)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1000, float(np.percentile(times, 90)) * 1000, outputs
+
+def optimize_onnx(src, dst, ort_format=False):
+    """Save ONNX Runtime's offline-optimized graph of src, as .onnx or in the .ort format."""
+    options = ort.SessionOptions()
+    # Extended rather than all: the layout transforms of the highest level are tied to the exporting machine's CPU
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.optimized_model_filepath = dst
+    if ort_format:
+        options.add_session_config_entry("session.save_model_format", "ORT")
+    ort.InferenceSession(src, options, providers=["CPUExecutionProvider"])
+
+def onnx_fp16_weights(src, dst):
+    """Copy of an ONNX model with its float32 weights stored as float16 and cast back to float32 on load."""
+    model = onnx.load(src)
+    graph = model.graph
+    casts = []
+    for init in graph.initializer:
+        if init.data_type != onnx.TensorProto.FLOAT:
+            continue
+        name = init.name
+        init.CopyFrom(onnx.numpy_helper.from_array(onnx.numpy_helper.to_array(init).astype(np.float16), name + "_fp16"))
+        casts.append(onnx.helper.make_node("Cast", [name + "_fp16"], [name], to=onnx.TensorProto.FLOAT))
+
+    renamed = {c.output[0] for c in casts}
+    inputs = [i for i in graph.input if i.name not in renamed]
+    del graph.input[:]
+    graph.input.extend(inputs)
+    nodes = casts + list(graph.node)
+    del graph.node[:]
+    graph.node.extend(nodes)
+    onnx.save(model, dst)
+
+def sample_frames(dataset, count, offset=0.0):
+    """
+    Up to count clean frames spread evenly over a side='both' dataset. An offset
+    in (0, 1) picks the frames between those of offset 0, for a disjoint sample.
+
+    Returns:
+        tuple: (frames, labels) as float32 arrays, frames ready as MultiChad input
+    """
+    view = copy.copy(dataset)
+    view.augment = False
+    n = min(count, len(dataset))
+    indices = ((np.arange(n) + offset) * len(dataset) / n).astype(int)
+    samples = [view[int(i)] for i in indices]
+    return (torch.stack([x.cpu() for x, _, _ in samples]).numpy(),
+            torch.stack([y.cpu() for _, y, _ in samples]).numpy())
+
+def run_onnx(path, frames, static_batch=False):
+    """
+    Outputs of an ONNX (or .ort) model for frames, one at a time for a static batch-1 graph.
+
+    Returns:
+        tuple: (outputs, session load seconds)
+    """
+    start = time.perf_counter()
+    session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+    load_s = time.perf_counter() - start
+    name = session.get_inputs()[0].name
+    if static_batch:
+        outputs = np.concatenate([session.run(None, {name: frames[i:i + 1]})[0] for i in range(len(frames))])
+    else:
+        outputs = session.run(None, {name: frames})[0]
+    return outputs, load_s
+
+class FrameCalibrationReader:
+    """Feeds calibration frames one at a time to ONNX Runtime's static quantization."""
+    def __init__(self, input_name, frames):
+        self.input_name = input_name
+        self.frames = frames
+        self.position = 0
+
+    def get_next(self):
+        if self.position >= len(self.frames):
+            return None
+        frame = self.frames[self.position:self.position + 1]
+        self.position += 1
+        return {self.input_name: frame}
+
+    def rewind(self):
+        self.position = 0
+
+def gaze_error_deg(outputs, labels):
+    """Mean absolute gaze error in degrees over both eyes' pitch and yaw."""
+    return float(np.abs(outputs - labels)[:, [0, 1, 3, 4]].mean() * 90)
+
+def static_quantize(src, dst, calibration):
+    """Statically quantize an fp32 ONNX model to INT8 (per-channel QDQ), calibrating on the given frames."""
+    # Shape inference and graph cleanup first, as ONNX Runtime recommends before quantizing
+    prepared = os.path.splitext(dst)[0] + "_prep.onnx"
+    try:
+        ort_quant.quant_pre_process(src, prepared, skip_symbolic_shape=True)
+    except Exception as e:
+        print("Quantization pre-processing failed (%s), quantizing the export as is" % e, flush=True)
+        prepared = src
+
+    input_name = ort.InferenceSession(src, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    ort_quant.quantize_static(prepared, dst, FrameCalibrationReader(input_name, calibration),
+                              quant_format=ort_quant.QuantFormat.QDQ, per_channel=True,
+                              activation_type=ort_quant.QuantType.QUInt8, weight_type=ort_quant.QuantType.QInt8,
+                              calibrate_method=ort_quant.CalibrationMethod.MinMax)
+    if prepared != src:
+        os.remove(prepared)
+
+def evaluate_onnx_models(models, frames, labels):
+    """
+    Gaze error, batch-1 latency and file size of each (name, path) in models on the same frames.
+
+    Returns:
+        dict: name -> metrics, each also holding the raw outputs under 'outputs'
+    """
+    results = {}
+    for name, path in models:
+        outputs, _ = run_onnx(path, frames)
+        median, p90, _ = onnx_latency(path, frames[:1], runs=100, warmup=10)
+        results[name] = {'gaze_error_deg': gaze_error_deg(outputs, labels), 'latency_ms': median, 'latency_p90_ms': p90,
+                         'size_bytes': os.path.getsize(path), 'outputs': outputs}
+    return results
+
+def print_onnx_results(results):
+    for name, r in results.items():
+        print("%-9s gaze error %.3f deg, batch-1 %.3f ms (p90 %.3f ms), %.1f MB" %
+              (name, r['gaze_error_deg'], r['latency_ms'], r['latency_p90_ms'], r['size_bytes'] / 2**20), flush=True)
+
+def quantize_int8(dataset, args):
+    """
+    Statically quantize the exported fp32 model to INT8 (per-channel QDQ), using
+    the user's own aligned frames for calibration, and write it next to the fp32
+    model. Accuracy and latency of both are compared on a separate sample of
+    frames; if INT8 adds more than --int8-budget-deg of gaze error, the INT8 model
+    is removed and the app keeps using fp32.
+
+    Returns:
+        str: path of the INT8 model, or None when it was not kept
+    """
+    if ort_quant is None:
+        print("onnxruntime is not installed, skipping INT8 quantization", flush=True)
+        return None
+
+    base = os.path.splitext(args.output)[0]
+    path = base + "_int8.onnx"
+    calibration, _ = sample_frames(dataset, args.int8_calibration_frames, offset=0.5)
+    frames, labels = sample_frames(dataset, 128)
+
+    start = time.time()
+    static_quantize(args.output, path, calibration)
+    quantize_s = time.time() - start
+
+    results = evaluate_onnx_models([("fp32", args.output), ("int8", path)], frames, labels)
+    fp32_out, int8_out = results['fp32'].pop('outputs'), results['int8'].pop('outputs')
+    report = {'calibration_frames': len(calibration), 'eval_frames': len(frames), 'quantize_seconds': quantize_s}
+    report.update(results)
+    report['delta_deg'] = report['int8']['gaze_error_deg'] - report['fp32']['gaze_error_deg']
+    report['max_deviation_deg'] = float(np.abs(int8_out - fp32_out)[:, [0, 1, 3, 4]].max() * 90)
+    report['kept'] = report['delta_deg'] <= args.int8_budget_deg
+
+    print("\n=== INT8 quantization (%d calibration / %d evaluation frames) ===\n" % (len(calibration), len(frames)), flush=True)
+    print_onnx_results(results)
+    print("INT8 adds %.3f deg of gaze error (largest deviation from fp32 %.3f deg), budget %.3f deg" %
+          (report['delta_deg'], report['max_deviation_deg'], args.int8_budget_deg), flush=True)
+
+    with open(base + "_int8_report.json", "w") as f:
+        json.dump(report, f, indent=2)
+
+    if not report['kept']:
+        os.remove(path)
+        print("INT8 model is over the error budget, keeping the fp32 model only", flush=True)
+        return None
+    print("INT8 model exported to ONNX: " + path, flush=True)
+    return path
+
+def export_qat_int8(qat_multi, dataset, args):
+    """Write the quantization-aware model as <output>_qat_int8.onnx and compare it with the fp32 export."""
+    path = os.path.splitext(args.output)[0] + "_qat_int8.onnx"
+    export_qdq(qat_multi, path)
+    print("Quantization-aware INT8 model exported to ONNX: " + path, flush=True)
+    if ort is None:
+        return path
+
+    frames, labels = sample_frames(dataset, 128)
+    results = evaluate_onnx_models([("fp32", args.output), ("qat int8", path)], frames, labels)
+    print("\n=== Quantization-aware INT8 export (%d frames) ===\n" % len(frames), flush=True)
+    print_onnx_results(results)
+    return path
+
+def compare_qat(args):
+    """
+    Train the same capture with and without quantization-aware epochs and compare
+    fp32, post-training INT8 of the fp32 model and the QAT INT8 export on held-out frames.
+    """
+    if ort_quant is None:
+        print("onnxruntime is not installed, can't compare quantization", flush=True)
+        return
+
+    dataset = load_capture_dataset(args.capture, 'both')
+    train_set, val_set = split_holdout(dataset, val_fraction=args.val_fraction)
+    frames, labels = sample_frames(frames_view(dataset, val_set.indices), 256)
+    calibration, _ = sample_frames(frames_view(dataset, train_set.indices), args.int8_calibration_frames)
+    qat_epochs = args.qat_epochs or 2
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {name: os.path.join(tmp, name + ".onnx") for name in ("fp32", "ptq", "qat")}
+        seconds = {}
+        for name, epochs in (("fp32", 0), ("qat", qat_epochs)):
+            torch.manual_seed(42)
+            np.random.seed(42)
+            args.qat_epochs = epochs
+            start = time.time()
+            model = train_calibration(load_baseline('both'), train_set, args, EPOCHS_AUG, EPOCHS_NOAUG,
+                                      e_total=EPOCHS_AUG + EPOCHS_NOAUG - 1)
+            seconds[name] = time.time() - start
+            if epochs:
+                export_qdq(model, paths['qat'])
+            else:
+                export_onnx(model, paths['fp32'])
+                static_quantize(paths['fp32'], paths['ptq'], calibration)
+        args.qat_epochs = qat_epochs
+
+        results = evaluate_onnx_models([("fp32", paths['fp32']), ("ptq int8", paths['ptq']), ("qat int8", paths['qat'])],
+                                       frames, labels)
+
+    print("\n=== Quantization comparison (%d held-out frames, QAT in the last %d augmented epochs + clean epoch) ===\n" %
+          (len(frames), qat_epochs), flush=True)
+    print("Training: fp32 %.1fs, with QAT %.1fs" % (seconds['fp32'], seconds['qat']), flush=True)
+    print_onnx_results(results)
+
+def tower_macs(tower, size=None):
+    """Multiply-adds of one tower for a size x size input (default the training resolution)."""
+    size = size or RESOLUTION
+    macs = 0
+    for i in range(tower.depth):
+        conv = getattr(tower, "conv%d" % (i + 1))
+        macs += size * size * conv.in_channels * conv.out_channels * conv.kernel_size[0] * conv.kernel_size[1] // conv.groups
+        if i < tower.depth - 1:
+            size //= 2
+    return macs + tower.fc.in_features * tower.fc.out_features
+
+def slice_tower(student, teacher, scores=None):
+    """
+    Start a narrower student tower from the teacher's strongest filters in each
+    layer, ranked by scores (one tensor per conv layer) or else by L1 norm. The
+    fc head is copied too when the depths match; layers wider than the teacher's
+    keep their random initialization.
+    """
+    keep = torch.arange(teacher.conv1.in_channels)
+    with torch.no_grad():
+        for i in range(min(student.depth, teacher.depth)):
+            s, t = getattr(student, "conv%d" % (i + 1)), getattr(teacher, "conv%d" % (i + 1))
+            if s.out_channels > t.out_channels:
+                return
+            weight = t.weight[:, keep]
+            score = weight.abs().sum(dim=(1, 2, 3)) if scores is None else scores[i]
+            keep = torch.argsort(score, descending=True)[:s.out_channels].sort().values
+            s.weight.copy_(weight[keep])
+            s.bias.copy_(t.bias[keep])
+        if student.depth == teacher.depth:
+            student.fc.weight.copy_(teacher.fc.weight[:, keep])
+            student.fc.bias.copy_(teacher.fc.bias)
+
+def distill(teacher, dataset, args, width_mult, depth, epochs=None):
+    """
+    Train a slimmer MultiChad to reproduce the teacher on the user's frames.
+
+    The student starts from the teacher's strongest filters and trains on
+    augmented frames, with a final clean epoch. The loss blends matching the
+    teacher's outputs with the labels, weighted by --distill-alpha.
+
+    Args:
+        teacher: fine-tuned full-size MultiChad
+        dataset: side='both' capture dataset (or a subset of one)
+        args: parsed arguments
+        width_mult: channel multiplier of the student
+        depth: conv blocks of the student
+        epochs: training epochs (default --distill-epochs)
+
+    Returns:
+        MultiChad: the trained student
+    """
+    global TRAINING
+
+    epochs = epochs or args.distill_epochs
+    student = MultiChad(width_mult, depth)
+    slice_tower(student.left, teacher.left)
+    slice_tower(student.right, teacher.right)
+    student = student.to(DEVICE)
+    teacher = teacher.to(DEVICE).eval()
+
+    criterion = nn.MSELoss()
+    optimizer = optim.AdamW(student.parameters(), lr=args.lr)
+    loader_len = len(make_loader(dataset, args))
+    scheduler = CosineAnnealingLR(optimizer, T_max=max(1, epochs * loader_len), eta_min=1e-5)
+
+    student.train()
+    for epoch in range(epochs):
+        TRAINING = epoch < epochs - 1
+        for i, (inputs, labels, _) in enumerate(make_loader(dataset, args, shuffle=True)):
+            inputs, labels = inputs.to(DEVICE), labels.to(DEVICE)
+            with torch.no_grad():
+                targets = teacher(inputs)
+            optimizer.zero_grad()
+            outputs = student(inputs)
+            loss = ((1 - args.distill_alpha) * calibration_loss(student, criterion, outputs, targets) +
+                    args.distill_alpha * calibration_loss(student, criterion, outputs, labels))
+            loss.backward()
+            optimizer.step()
+            scheduler.step()
+            print("\rDistill epoch %d/%d, Batch %u/%u, Loss: %.6f" % (epoch + 1, epochs, i, loader_len, float(loss)), flush=True)
+    TRAINING = True
+    return student
+
+def export_slim(multi, dataset, args):
+    """Distill the trained model into a --distill-width/--distill-depth MultiChad and write it as <output>_slim.onnx."""
+    start = time.time()
+    student = distill(multi, dataset, args, args.distill_width, args.distill_depth)
+    path = os.path.splitext(args.output)[0] + "_slim.onnx"
+    export_onnx(student, path)
+
+    frames, _ = sample_frames(dataset, 256)
+    with torch.no_grad():
+        x = torch.from_numpy(frames)
+        diff = np.abs(student.to("cpu").eval()(x).numpy() - multi.to("cpu").eval()(x).numpy())
+    print("\nSlim model (width %.2f, depth %d) distilled in %.1fs: %.1f%% of the parameters, %.1f%% of the multiply-adds, "
+          "%.3f deg mean gaze difference from the full model" %
+          (args.distill_width, args.distill_depth, time.time() - start,
+           100.0 * count_parameters(student) / count_parameters(multi),
+           100.0 * tower_macs(student.left) / tower_macs(multi.left), diff[:, [0, 1, 3, 4]].mean() * 90), flush=True)
+    print("Slim model exported to ONNX: " + path, flush=True)
+    return path
+
+def compare_widths(args):
+    """
+    Fine-tune the full-size model on a training split, distill it at each of
+    --distill-widths and print accuracy on held-out frames against size and
+    batch-1 ONNX Runtime latency.
+    """
+    if ort is None:
+        print("onnxruntime is not installed, can't measure latency", flush=True)
+        return
+
+    dataset = load_capture_dataset(args.capture, 'both')
+    train_set, val_set = split_holdout(dataset, val_fraction=args.val_fraction)
+    frames, labels = sample_frames(frames_view(dataset, val_set.indices), 256)
+    start = time.time()
+    teacher = train_calibration(load_baseline('both'), train_set, args, EPOCHS_AUG, EPOCHS_NOAUG,
+                                e_total=EPOCHS_AUG + EPOCHS_NOAUG - 1)
+    teacher_s = time.time() - start
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for width in [float(w) for w in args.distill_widths.split(',') if w.strip()]:
+            start = time.time()
+            if width == 1.0 and args.distill_depth == len(MICROCHAD_CHANNELS):
+                model = teacher
+            else:
+                torch.manual_seed(42)
+                model = distill(teacher, train_set, args, width, args.distill_depth)
+            seconds = teacher_s if model is teacher else time.time() - start
+            with torch.no_grad():
+                outputs = model.to("cpu").eval()(torch.from_numpy(frames)).numpy()
+            path = os.path.join(tmp, "w%.2f.onnx" % width)
+            export_onnx(model, path)
+            median, p90, _ = onnx_latency(path, frames[:1], runs=100, warmup=10)
+            rows.append((width, count_parameters(model), tower_macs(model.left) * 2, gaze_error_deg(outputs, labels),
+                         median, p90, seconds))
+
+    print("\n=== Width sweep (depth %d, %d held-out frames) ===\n" % (args.distill_depth, len(frames)), flush=True)
+    print("%6s %10s %10s %12s %12s %10s %10s" % ("width", "params", "MMACs", "gaze error", "batch-1 ms", "p90 ms", "train s"), flush=True)
+    for width, params, macs, error, median, p90, seconds in rows:
+        print("%6.2f %10d %10.1f %8.3f deg %12.3f %10.3f %10.1f" % (width, params, macs / 1e6, error, median, p90, seconds), flush=True)
+
+def activation_scores(tower, inputs, batch_size=32):
+    """Mean post-ReLU activation of every conv filter of a tower over inputs, one tensor per layer."""
+    tower = tower.to("cpu").eval()
+    sums = [torch.zeros(getattr(tower, "conv%d" % (i + 1)).out_channels) for i in range(tower.depth)]
+    with torch.no_grad():
+        for b in range(0, len(inputs), batch_size):
+            x = inputs[b:b + batch_size]
+            for i in range(tower.depth):
+                x = tower.act(getattr(tower, "conv%d" % (i + 1))(x))
+                sums[i] += x.mean(dim=(2, 3)).sum(dim=0)
+                if i < tower.depth - 1:
+                    x = tower.pool(x)
+    return [s / len(inputs) for s in sums]
+
+def prune_multi(multi, dataset, args):
+    """
+    Remove the lowest-ranked --prune fraction of filters from every conv layer of
+    both towers, along with the matching input channels of the next layer and fc.
+    Filters are ranked by weight norm or by their mean activation on the user's
+    aligned frames (--prune-criterion).
+
+    Returns:
+        MultiChad: the physically smaller model, before recovery fine-tuning
+    """
+    counts = [max(4, int(round(getattr(multi.left, "conv%d" % (i + 1)).out_channels * (1 - args.prune))))
+              for i in range(multi.left.depth)]
+    pruned = MultiChad(channels=counts)
+    scores = (None, None)
+    if args.prune_criterion == "activation":
+        frames, _ = sample_frames(dataset, args.prune_frames)
+        x = torch.from_numpy(frames)
+        scores = (activation_scores(multi.left, x[:, [0, 2, 4, 6]]), activation_scores(multi.right, x[:, [1, 3, 5, 7]]))
+    slice_tower(pruned.left, multi.left, scores[0])
+    slice_tower(pruned.right, multi.right, scores[1])
+    return pruned.to(DEVICE)
+
+def export_pruned(multi, dataset, args):
+    """
+    Prune the trained model, recover with a short fine-tune and write it as
+    <output>_pruned.onnx, reporting the size, multiply-add and latency reduction
+    against the unpruned export in <output>_pruned_report.json.
+    """
+    base = os.path.splitext(args.output)[0]
+    path = base + "_pruned.onnx"
+
+    start = time.time()
+    pruned = prune_multi(multi, dataset, args)
+    if args.prune_finetune_epochs > 0:
+        finetune_full(pruned, dataset, args, args.prune_finetune_epochs, lr=args.lr)
+    prune_s = time.time() - start
+    export_onnx(pruned, path)
+
+    report = {'criterion': args.prune_criterion, 'fraction': args.prune, 'finetune_epochs': args.prune_finetune_epochs,
+              'seconds': prune_s, 'channels': [getattr(pruned.left, "conv%d" % (i + 1)).out_channels for i in range(pruned.left.depth)],
+              'params': count_parameters(pruned), 'params_unpruned': count_parameters(multi),
+              'macs': tower_macs(pruned.left) * 2, 'macs_unpruned': tower_macs(multi.left) * 2}
+    print("\n=== Structured pruning (%s criterion, %.0f%% of the filters removed, %.1fs) ===\n" %
+          (args.prune_criterion, args.prune * 100, prune_s), flush=True)
+    print("Pruned model keeps %.1f%% of the parameters (%d) and %.1f%% of the multiply-adds (%.1f M)" %
+          (100.0 * report['params'] / report['params_unpruned'], report['params'],
+           100.0 * report['macs'] / report['macs_unpruned'], report['macs'] / 1e6), flush=True)
+
+    if ort is not None:
+        frames, labels = sample_frames(dataset, 256)
+        results = evaluate_onnx_models([("unpruned", args.output), ("pruned", path)], frames, labels)
+        for r in results.values():
+            r.pop('outputs')
+        report.update(results)
+        print_onnx_results(results)
+    else:
+        print("onnxruntime is not installed, latency was not measured", flush=True)
+
+    with open(base + "_pruned_report.json", "w") as f:
+        json.dump(report, f, indent=2)
+    print("Pruned model exported to ONNX: " + path, flush=True)
+    return path
+
+def compare_resolutions(args):
+    """
+    Fine-tune the same capture at each of --resolutions (and progressively resized
+    up to the largest) and print the multiply-adds, training time, batch-1 ONNX
+    Runtime latency and held-out gaze error of each.
+    """
+    sizes = sorted({int(r) for r in args.resolutions.split(',') if r.strip()}, reverse=True)
+    dataset = load_capture_dataset(args.capture, 'both')
+    train_set, val_set = split_holdout(dataset, val_fraction=args.val_fraction)
+    held_out = frames_view(dataset, val_set.indices)
+    progressive = args.progressive_resize
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size, progressive_resize in [(s, False) for s in sizes] + [(sizes[0], True)]:
+            # The capture stays loaded; only the size its frames are decoded at changes
+            dataset.resolution = held_out.resolution = size
+            args.progressive_resize = progressive_resize
+            torch.manual_seed(42)
+            np.random.seed(42)
+            frames, labels = sample_frames(held_out, 256)
+            start = time.time()
+            model = train_calibration(load_baseline('both'), train_set, args, EPOCHS_AUG, EPOCHS_NOAUG,
+                                      e_total=EPOCHS_AUG + EPOCHS_NOAUG - 1)
+            seconds = time.time() - start
+            with torch.no_grad():
+                outputs = model.to("cpu").eval()(torch.from_numpy(frames)).numpy()
+            latency = None
+            if ort is not None:
+                path = os.path.join(tmp, "r%d.onnx" % size)
+                export_onnx(model, path, size=size)
+                latency, _, _ = onnx_latency(path, frames[:1], runs=100, warmup=10)
+            name = "%d%s" % (size, " prog" if progressive_resize else "")
+            rows.append((name, tower_macs(model.left, size) * 2, seconds, latency, gaze_error_deg(outputs, labels)))
+    args.progressive_resize = progressive
+
+    full = tower_macs(MicroChad(), INPUT_SIZE) * 2
+    print("\n=== Resolution comparison (%d held-out frames, progressive from %d) ===\n" %
+          (len(frames), args.progressive_min), flush=True)
+    print("%-10s %10s %10s %10s %12s %12s" % ("resolution", "MMACs", "compute", "train s", "batch-1 ms", "gaze error"), flush=True)
+    for name, macs, seconds, latency, error in rows:
+        print("%-10s %10.1f %9.0f%% %10.1f %12s %8.3f deg" %
+              (name, macs / 1e6, 100.0 * macs / full, seconds, "%.3f" % latency if latency is not None else "n/a", error), flush=True)
+
+EXPORT_VARIANTS = ("static", "optimized", "ort", "fp16")
+
+def export_variants(multi, exported, dataset, args):
+    """
+    Write the export variants selected with --export-variants next to args.output
+    and check each against the PyTorch MultiChad on real aligned frames. Variants
+    that don't match are deleted.
+
+    Args:
+        multi: trained MultiChad, the parity reference
+        exported: the model that was exported to args.output (MultiChad or FusedMultiChad)
+        dataset: side='both' CaptureDataset the parity frames are sampled from
+        args: parsed arguments
+    """
+    variants = [v.strip() for v in args.export_variants.split(',') if v.strip()]
+    for v in variants:
+        if v not in EXPORT_VARIANTS:
+            raise ValueError(f"Unknown export variant '{v}', expected some of {', '.join(EXPORT_VARIANTS)}")
+
+    base = os.path.splitext(args.output)[0]
+    paths = {'static': base + "_b1.onnx", 'optimized': base + "_opt.onnx", 'ort': base + ".ort", 'fp16': base + "_fp16.onnx"}
+    if ort is None and ('optimized' in variants or 'ort' in variants):
+        print("onnxruntime is not installed, skipping the optimized variants", flush=True)
+        variants = [v for v in variants if v not in ('optimized', 'ort')]
+
+    if 'static' in variants:
+        export_onnx(exported, paths['static'], dynamic_batch=False)
+    if 'optimized' in variants:
+        optimize_onnx(args.output, paths['optimized'])
+    if 'ort' in variants:
+        optimize_onnx(args.output, paths['ort'], ort_format=True)
+    if 'fp16' in variants:
+        onnx_fp16_weights(args.output, paths['fp16'])
+
+    if ort is None:
+        print("onnxruntime is not installed, export variants were not checked for parity", flush=True)
+        return
+
+    frames, _ = sample_frames(dataset, 64)
+    with torch.no_grad():
+        reference = multi.to("cpu").eval()(torch.from_numpy(frames)).numpy()
+
+    print("\n=== Export variants (parity on %d aligned frames) ===\n" % len(frames), flush=True)
+    for variant, path in [("default", args.output)] + [(v, paths[v]) for v in variants]:
+        outputs, load_s = run_onnx(path, frames, static_batch=variant == "static")
+        diff = np.abs(outputs - reference)
+        gaze_deg = diff[:, [0, 1, 3, 4]].max() * 90
+        median, _, _ = onnx_latency(path, frames[:1], runs=100, warmup=10)
+        # fp16 weights carry ~3 significant digits, everything else must match float32
+        ok = diff.max() <= (2e-3 if variant == "fp16" else 1e-4)
+        print("%-9s %-28s load %6.1f ms, batch-1 %.3f ms, max difference %.2e (%.3f deg) %s" %
+              (variant, os.path.basename(path), load_s * 1000, median, diff.max(), gaze_deg, "ok" if ok else "MISMATCH"), flush=True)
+        if not ok and variant != "default":
+            os.remove(path)
+            print("Removed %s, it doesn't match the trained model" % path, flush=True)
+
+def latency_percentiles(session, feed, runs, warmup):
+    """Per-call latency of session on feed, in ms at the 50th, 95th and 99th percentile."""
+    for _ in range(warmup):
+        session.run(None, feed)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        session.run(None, feed)
+        times.append(time.perf_counter() - start)
+    p50, p95, p99 = np.percentile(times, [50, 95, 99]) * 1000
+    return {'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99)}
+
+def thread_counts(spec):
+    """Thread counts to sweep: the comma-separated spec, or powers of two up to the physical cores."""
+    if spec:
+        return sorted({max(1, int(t)) for t in spec.split(',') if t.strip()})
+    cores = ThreadBudget.detect_physical_cores()
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+def verify_onnx(reference, path, dataset, args):
+    """
+    Check an ONNX export against the PyTorch MultiChad on real aligned frames and
+    benchmark it in ONNX Runtime on the CPU provider: batch-1 latency percentiles
+    and throughput at larger batches, for each intra-op thread count. The report
+    is written to --verify-report (default <output>_verify.json).
+
+    Args:
+        reference: MultiChad the export must match
+        path: ONNX model to check
+        dataset: side='both' CaptureDataset the frames are sampled from
+        args: parsed arguments
+
+    Returns:
+        bool: whether every frame matched within --parity-tolerance
+    """
+    report_path = args.verify_report or os.path.splitext(path)[0] + "_verify.json"
+    report = {'model': os.path.abspath(path), 'size_bytes': os.path.getsize(path), 'tolerance': args.parity_tolerance,
+              'machine': {'node': platform.node(), 'processor': platform.processor() or platform.machine(),
+                          'physical_cores': ThreadBudget.detect_physical_cores()},
+              'onnxruntime': ort.__version__ if ort is not None else None}
+    if ort is None:
+        print("onnxruntime is not installed, can't verify the export", flush=True)
+        report['passed'] = False
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        return False
+
+    frames, labels = sample_frames(dataset, args.verify_frames)
+    with torch.no_grad():
+        expected = reference.to("cpu").eval()(torch.from_numpy(frames)).numpy()
+
+    session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+    name = session.get_inputs()[0].name
+    static_batch = isinstance(session.get_inputs()[0].shape[0], int)
+    # Batch 1 is how the app runs it; the batched pass also checks the dynamic batch axis
+    outputs = np.concatenate([session.run(None, {name: frames[i:i + 1]})[0] for i in range(len(frames))])
+    diff = np.abs(outputs - expected)
+    if not static_batch:
+        diff = np.maximum(diff, np.abs(session.run(None, {name: frames})[0] - expected))
+    report['parity'] = {'frames': len(frames), 'max_abs_diff': float(diff.max()), 'mean_abs_diff': float(diff.mean()),
+                        'max_gaze_diff_deg': float(diff[:, [0, 1, 3, 4]].max() * 90),
+                        'onnx_gaze_error_deg': gaze_error_deg(outputs, labels),
+                        'torch_gaze_error_deg': gaze_error_deg(expected, labels)}
+    report['passed'] = bool(diff.max() <= args.parity_tolerance)
+
+    print("\n=== ONNX verification of %s (%d aligned frames) ===\n" % (path, len(frames)), flush=True)
+    print("Parity: max difference %.2e (%.4f deg), mean %.2e, tolerance %.0e: %s" %
+          (diff.max(), report['parity']['max_gaze_diff_deg'], diff.mean(), args.parity_tolerance,
+           "ok" if report['passed'] else "MISMATCH"), flush=True)
+
+    batches = [] if static_batch else [int(b) for b in args.verify_batches.split(',') if b.strip()]
+    report['runs'] = []
+    for threads in thread_counts(args.verify_threads):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        run = {'threads': threads, 'batch1': latency_percentiles(session, {name: frames[:1]}, args.verify_runs, args.verify_runs // 10)}
+        run['throughput'] = {}
+        for batch in batches:
+            feed = {name: np.resize(frames, (batch,) + frames.shape[1:])}
+            stats = latency_percentiles(session, feed, max(10, args.verify_runs // 10), 3)
+            run['throughput'][str(batch)] = batch * 1000 / stats['p50_ms']
+        report['runs'].append(run)
+        print("%2d threads: batch-1 p50 %.3f ms, p95 %.3f ms, p99 %.3f ms%s" %
+              (threads, run['batch1']['p50_ms'], run['batch1']['p95_ms'], run['batch1']['p99_ms'],
+               "".join(", batch-%s %.0f frames/s" % (b, fps) for b, fps in run['throughput'].items())), flush=True)
+
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Verification report written to " + report_path, flush=True)
+    return report['passed']
+
+def verify_existing(args):
+    """Verify args.output against the PyTorch models saved by the last calibration (left_tuned.pth/right_tuned.pth)."""
+    multi = MultiChad()
+    multi.left.load_state_dict(torch.load("left_tuned.pth", map_location="cpu"))
+    multi.right.load_state_dict(torch.load("right_tuned.pth", map_location="cpu"))
+    return verify_onnx(multi, args.output, load_capture_dataset(args.capture, 'both'), args)
+
+def benchmark_fused_export(args):
+    """Export the baseline MultiChad unfused and in both fused forms, and compare batch-1 ONNX Runtime latency."""
+    if ort is None:
+        print("onnxruntime is not installed, can't benchmark the export", flush=True)
+        return
+
+    multi = load_baseline('both').to("cpu").eval()
+    example = np.random.rand(1, 8, RESOLUTION, RESOLUTION).astype(np.float32)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, model in (("MultiChad", multi), ("fused-gather", fuse_for_export(multi, "gather")),
+                             ("fused-dense", fuse_for_export(multi, "dense"))):
+            path = os.path.join(tmp, "%s.onnx" % label)
+            export_onnx(model, path)
+            results.append((label, os.path.getsize(path)) + onnx_latency(path, example))
+
+    print("\n=== ONNX Runtime latency, batch 1 ===\n", flush=True)
+    for label, size, median, p90, outputs in results:
+        print("%-13s median %.3f ms (%.2fx), p90 %.3f ms, max output difference %.2e" %
+              (label, median, results[0][2] / median, p90, np.abs(outputs - results[0][4]).max()), flush=True)
+
+def benchmark_streaming(args, frames=200):
+    """
+    Replay the capture frame by frame through StreamingMultiChad and the 8-channel
+    MultiChad, check that they agree and compare the median per-frame latency of
+    the model alone and including preprocessing. Each frame is decoded and
+    preprocessed once and both paths run on the same arrays: the 8-channel model
+    keeps the last four preprocessed frames, the way a real-time caller would,
+    so the comparison is between the models alone.
+    """
+    multi = load_baseline('both').to("cpu").eval()
+    # Every frame, so consecutive entries are consecutive camera frames
+    dataset = CaptureDataset(args.capture, all_frames=True, side='both')
+    dataset.augment = False
+    n = min(frames, len(dataset))
+
+    engine = StreamingMultiChad(multi)
+    # Newest frame last; the 8-channel input takes the current frame, then the others oldest first
+    window = deque(maxlen=len(FRAME_SLOTS))
+    # Fill the window with the first sample's previous frames, which produce no output
+    for previous in dataset.aligned_frames[0][4]:
+        eyes = dataset.preprocess_eye(previous[1]), dataset.preprocess_eye(previous[2])
+        window.append(np.stack(eyes))
+        engine.push_frame(*eyes)
+
+    times = {'naive': ([], []), 'streaming': ([], [])}
+    max_diff = 0.0
+    for i in range(n):
+        _, left_jpeg, right_jpeg, _, _ = dataset.aligned_frames[i]
+        start = time.perf_counter()
+        left, right = dataset.preprocess_eye(left_jpeg), dataset.preprocess_eye(right_jpeg)
+        preprocess_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        streamed = engine.push_frame(left, right)
+        model_s = time.perf_counter() - start
+        times['streaming'][0].append(model_s)
+        times['streaming'][1].append(preprocess_s + model_s)
+
+        start = time.perf_counter()
+        window.append(np.stack((left, right)))
+        x = torch.from_numpy(np.concatenate([window[-1]] + list(window)[:-1])).unsqueeze(0)
+        with torch.no_grad():
+            stacked = multi(x)[0].numpy()
+        model_s = time.perf_counter() - start
+        times['naive'][0].append(model_s)
+        times['naive'][1].append(preprocess_s + model_s)
+        max_diff = max(max_diff, float(np.abs(streamed - stacked).max()))
+
+    print("\n=== Streaming inference (%d consecutive frames, median per frame) ===\n" % n, flush=True)
+    for name, label in (("naive", "8-channel MultiChad"), ("streaming", "streaming engine")):
+        model_s, total_s = times[name]
+        print("%-20s model %.3f ms, with preprocessing %.3f ms" %
+              (label, np.median(model_s) * 1000, np.median(total_s) * 1000), flush=True)
+    print("Largest output difference %.2e (%.4f deg)" % (max_diff, max_diff * 90), flush=True)
+    print("Both paths do the same conv1 multiply-adds; the streaming engine also moves partial sums "
+          "four times the size of conv1's output, so it can be the slower of the two.", flush=True)
+
+def compare_precision(args):
+    """
+    Train fp32 and bf16 copies of the baseline on the same held-out split and
+    report per-epoch throughput and validation accuracy for both modes.
+    Both models are evaluated in fp32, which is how the exported ONNX runs.
+    """
+    side = 'both' if args.joint else 'left'
+    dataset = load_capture_dataset(args.capture, side)
+    train_set, val_set = split_holdout(dataset, val_fraction=args.val_fraction)
+    val_loader = make_loader(val_set, args, shuffle=False)
+
+    results = {}
+    for precision in ("fp32", "bf16"):
+        torch.manual_seed(42)
+        np.random.seed(42)
+
+        history = []
+        model, _, _ = train_model(
+            load_baseline(side),
+            None,
+            make_loader(train_set, args, shuffle=True),
+            num_epochs=args.compare_epochs,
+            lr=args.lr,
+            class_step=True,
+            e_total=args.compare_epochs - 1,
+            precision=precision,
+            history=history
+        )
+        results[precision] = (history, evaluate_model(model, val_loader))
+
+    print("\n=== Precision comparison (%d train / %d held-out frames) ===\n" % (len(train_set), len(val_set)), flush=True)
+    for precision, (history, metrics) in results.items():
+        for h in history:
+            print("%s epoch %d: %.1f samples/s, loss %.6f" % (precision, h['epoch'], h['samples_per_sec'], h['loss']), flush=True)
+        mean_rate = np.mean([h['samples_per_sec'] for h in history])
+        print("%s: mean %.1f samples/s, held-out MSE %.6f, gaze error %.3f deg\n" %
+              (precision, mean_rate, metrics['mse'], metrics['gaze_error_deg']), flush=True)
+
+    speedup = np.mean([h['samples_per_sec'] for h in results["bf16"][0]]) / np.mean([h['samples_per_sec'] for h in results["fp32"][0]])
+    delta = results["bf16"][1]['gaze_error_deg'] - results["fp32"][1]['gaze_error_deg']
+    print("bf16 vs fp32: %.2fx throughput, %+.3f deg gaze error" % (speedup, delta), flush=True)
+
+def benchmark_execution_modes(args, steps=30, frames=200):
+    """
+    Report training steps/sec and batch-1 inference frames/sec for eager NCHW
+    execution against the channels_last / compiled / frozen TorchScript paths.
+    """
+    side = 'both' if args.joint else 'left'
+    criterion = nn.MSELoss()
+    n_out = 6 if side == 'both' else 3
+
+    print("\n=== Execution mode benchmark ===\n", flush=True)
+    for mode in ("off", "channels_last", "compile"):
+        model = load_baseline(side)
+        model.train()
+        step_model = compile_for_training(model, mode)
+        optimizer = optim.AdamW(model.parameters(), lr=1e-5)
+
+        inputs = torch.rand(32, input_channels(model), RESOLUTION, RESOLUTION, device=DEVICE)
+        labels = torch.rand(32, n_out, device=DEVICE)
+        if mode != "off":
+            inputs = inputs.contiguous(memory_format=torch.channels_last)
+
+        for i in range(steps + 3):
+            if i == 3:
+                start = time.time()
+            optimizer.zero_grad()
+            loss = criterion(step_model(inputs), labels)
+            loss.backward()
+            optimizer.step()
+        print("train %-13s: %.2f steps/s (batch 32)" % (mode, steps / (time.time() - start)), flush=True)
+
+    example = torch.rand(1, 8, RESOLUTION, RESOLUTION)
+    multi = load_baseline('both').cpu().eval()
+    for name, runner in (("eager", multi), ("torchscript", optimize_for_inference(load_baseline('both').cpu(), example))):
+        x = example.contiguous(memory_format=torch.channels_last) if name != "eager" else example
+        with torch.no_grad():
+            for _ in range(10):
+                runner(x)
+            start = time.time()
+            for _ in range(frames):
+                runner(x)
+        print("infer %-13s: %.1f frames/s (MultiChad, batch 1)" % (name, frames / (time.time() - start)), flush=True)
+
 def normalize_similarity(similarity):
     return (similarity + 1) / 2
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fine-tune the per-user MicroChad gaze models and export them to ONNX")
+    parser.add_argument("capture", help="Calibration capture file")
+    parser.add_argument("output", help="Path of the exported ONNX model")
+    parser.add_argument("--loader", choices=["threaded", "torch"], default=None,
+                        help="Batch loader: thread-pool prefetching, which needs no multiprocessing, or the torch DataLoader "
+                             "(default: threaded in the packaged trainer, torch otherwise)")
+    parser.add_argument("--loader-workers", type=int, default=None,
+                        help="Decode/augment threads for the threaded loader (default: from the thread budget)")
+    parser.add_argument("--prefetch-batches", type=int, default=2,
+                        help="Batches the threaded loader prepares ahead of the training step")
+    parser.add_argument("--threads", default="",
+                        help="Thread budget override, e.g. torch=6,workers=2,cv2=1,interop=1")
+    parser.add_argument("--autotune-threads", action="store_true",
+                        help="Pick the torch/loader split with a short warm-up run before training (--loader threaded only)")
+    parser.add_argument("--joint", action="store_true",
+                        help="Train the left and right models together as one MultiChad over 8-channel batches")
+    parser.add_argument("--precision", choices=["fp32", "bf16"], default="fp32",
+                        help="Training precision; bf16 uses CPU autocast around the forward pass")
+    parser.add_argument("--compare-precision", action="store_true",
+                        help="Benchmark fp32 against bf16 training on a held-out split and exit")
+    parser.add_argument("--compare-epochs", type=int, default=EPOCHS_AUG,
+                        help="Epochs per mode for --compare-precision")
+    parser.add_argument("--compile", choices=["off", "channels_last", "compile"], default="off",
+                        help="Training execution mode: eager NCHW, eager channels_last, or torch.compile with channels_last")
+    parser.add_argument("--benchmark-compile", action="store_true",
+                        help="Benchmark training and inference with and without the compiled paths and exit")
+    parser.add_argument("--time-budget", type=float, default=0,
+                        help="Wall-clock budget in seconds for the whole calibration; sizes the step count to fit")
+    parser.add_argument("--checkpoint", default="trainermin_checkpoint.pt",
+                        help="Training checkpoint file")
+    parser.add_argument("--checkpoint-every", type=int, default=None,
+                        help="Also checkpoint every N batches within an epoch (default 20, or 0 with --temporal-runs; "
+                             "0 = epoch ends only, -1 = disable)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted calibration from the checkpoint file")
+    parser.add_argument("--fast-calibration", action="store_true",
+                        help="Freeze the backbone and train only the fc head on cached features")
+    parser.add_argument("--head-epochs", type=int, default=200,
+                        help="Head training epochs over the cached features")
+    parser.add_argument("--head-aug-variants", type=int, default=4,
+                        help="Augmented copies of every frame to cache alongside the clean one")
+    parser.add_argument("--head-finetune-epochs", type=int, default=0,
+                        help="Short full fine-tune after head training (0 = none)")
+    parser.add_argument("--compare-fast-calibration", action="store_true",
+                        help="Compare fast calibration against full fine-tuning on a held-out split and exit")
+    parser.add_argument("--freeze-blocks", type=int, default=0, choices=range(0, 6),
+                        help="Freeze the first k conv blocks and cache their activations for clean samples")
+    parser.add_argument("--freeze-cache-mb", type=int, default=512,
+                        help="Memory cap for cached frozen-block activations")
+    parser.add_argument("--sweep-freeze", default="",
+                        help="Comma separated k values (0-5) to compare, e.g. 0,1,2,3,4; reports and exits")
+    parser.add_argument("--adapters", action="store_true",
+                        help="Fine-tune low-rank and scale/shift adapters on frozen baseline weights, merged before export")
+    parser.add_argument("--adapter-rank", type=int, default=4,
+                        help="Rank of the low-rank adapters (0 = per-channel scale/shift only)")
+    parser.add_argument("--early-stopping", action="store_true",
+                        help="Hold out part of the capture and stop the augmented epochs once validation stops improving")
+    parser.add_argument("--patience", type=int, default=2,
+                        help="Validation checks without improvement before stopping")
+    parser.add_argument("--min-delta", type=float, default=1e-5,
+                        help="Minimum validation MSE decrease that counts as an improvement")
+    parser.add_argument("--eval-every", type=int, default=0,
+                        help="Validate every N batches (0 = once per epoch)")
+    parser.add_argument("--val-fraction", type=float, default=0.1,
+                        help="Fraction of aligned frames held out for validation")
+    parser.add_argument("--coreset", type=float, default=0,
+                        help="Train on this fraction of the aligned frames, picked for diversity (0 = all frames)")
+    parser.add_argument("--coreset-embedding", choices=["pixels", "features"], default="pixels",
+                        help="Frame embedding for coreset selection: downsampled pixels or baseline backbone features")
+    parser.add_argument("--coreset-label-weight", type=float, default=1.0,
+                        help="Weight of label position relative to the image embedding in coreset selection")
+    parser.add_argument("--compare-coreset", action="store_true",
+                        help="Compare epochs and time to target error of the coreset against the full set, then exit")
+    parser.add_argument("--coreset-target-deg", type=float, default=0,
+                        help="Target gaze error for --compare-coreset (0 = 5%% above the full set's best)")
+    parser.add_argument("--hard-examples", action="store_true",
+                        help="Sample frames in proportion to their running loss during the augmented epochs")
+    parser.add_argument("--hard-epoch-fraction", type=float, default=1.0,
+                        help="Frames drawn per epoch with --hard-examples, as a fraction of the training set")
+    parser.add_argument("--hard-floor", type=float, default=0.2,
+                        help="Share of sampling probability spread uniformly over all frames with --hard-examples")
+    parser.add_argument("--compare-samplers", action="store_true",
+                        help="Compare uniform and loss-aware sampling on a held-out split, then exit")
+    parser.add_argument("--batch-size", type=int, default=BASE_BATCH_SIZE,
+                        help="Training batch size; the LR is scaled from %d by --lr-scaling" % BASE_BATCH_SIZE)
+    parser.add_argument("--lr-scaling", choices=["sqrt", "linear", "none"], default="sqrt",
+                        help="How the learning rate follows the batch size")
+    parser.add_argument("--autotune-batch", action="store_true",
+                        help="Benchmark a few batch sizes on this machine and train with the fastest")
+    parser.add_argument("--batch-memory-mb", type=float, default=2048,
+                        help="Peak training memory allowed for --autotune-batch")
+    parser.add_argument("--batch-cache", default="trainermin_autotune.json",
+                        help="Per-machine cache of --autotune-batch results")
+    parser.add_argument("--distributed", action="store_true",
+                        help="Data-parallel training over the ranks started by torchrun (gloo backend)")
+    parser.add_argument("--corpus", nargs="+", default=[],
+                        help="More capture files to train on together with the calibration capture")
+    parser.add_argument("--from-scratch", action="store_true",
+                        help="Start from randomly initialized models instead of the baselines")
+    parser.add_argument("--benchmark-scaling", type=int, default=0,
+                        help="Report data-parallel scaling from 1 to N local ranks, then exit")
+    parser.add_argument("--scaling-probe", action="store_true",
+                        help="Timed run for the scaling benchmark (launched with torchrun)")
+    parser.add_argument("--scaling-report", default="trainermin_scaling.jsonl",
+                        help="File the scaling probes append their throughput to")
+    parser.add_argument("--export-fused", choices=["off", "gather", "dense"], default="off",
+                        help="Export both towers merged into one grouped-convolution network, reordering the input "
+                             "once (gather) or with a zero-padded first layer (dense)")
+    parser.add_argument("--export-variants", default="",
+                        help="Also write these variants next to the output, checked for parity: "
+                             "static (batch 1), optimized (ORT-optimized .onnx), ort (.ort format), fp16 (float16 weights)")
+    parser.add_argument("--int8", action="store_true",
+                        help="Also write a statically quantized INT8 model, calibrated on the capture's frames")
+    parser.add_argument("--int8-calibration-frames", type=int, default=256,
+                        help="Aligned frames used to calibrate INT8 activation ranges")
+    parser.add_argument("--int8-budget-deg", type=float, default=0.5,
+                        help="Largest increase in mean gaze error INT8 may add before falling back to fp32")
+    parser.add_argument("--qat-epochs", type=int, default=0,
+                        help="Quantization-aware training in the last N augmented epochs and the clean epoch, "
+                             "and export <output>_qat_int8.onnx (0 = off)")
+    parser.add_argument("--compare-qat", action="store_true",
+                        help="Compare fp32, post-training INT8 and quantization-aware INT8 on a held-out split, then exit")
+    parser.add_argument("--benchmark-export", action="store_true",
+                        help="Compare batch-1 ONNX Runtime latency of the unfused and fused export, then exit")
+    parser.add_argument("--distill-width", type=float, default=0,
+                        help="Also distill the trained model into a MicroChad this wide and export <output>_slim.onnx (0 = off)")
+    parser.add_argument("--distill-depth", type=int, default=len(MICROCHAD_CHANNELS), choices=range(1, len(MICROCHAD_CHANNELS) + 1),
+                        help="Conv blocks of the distilled model")
+    parser.add_argument("--distill-epochs", type=int, default=EPOCHS_AUG + EPOCHS_NOAUG,
+                        help="Distillation epochs; the last one runs without augmentation")
+    parser.add_argument("--distill-alpha", type=float, default=0.3,
+                        help="Weight of the labels in the distillation loss; the rest goes to matching the full model")
+    parser.add_argument("--distill-widths", default="1.0,0.75,0.5,0.35",
+                        help="Width multipliers compared by --compare-widths")
+    parser.add_argument("--compare-widths", action="store_true",
+                        help="Compare accuracy and latency of distilled models across --distill-widths, then exit")
+    parser.add_argument("--prune", type=float, default=0,
+                        help="Also remove this fraction of every conv layer's filters, fine-tune and export <output>_pruned.onnx (0 = off)")
+    parser.add_argument("--prune-criterion", choices=["norm", "activation"], default="activation",
+                        help="Rank filters by weight L1 norm or by mean activation on the capture's frames")
+    parser.add_argument("--prune-frames", type=int, default=256,
+                        help="Aligned frames the activation criterion is measured on")
+    parser.add_argument("--prune-finetune-epochs", type=int, default=2,
+                        help="Recovery fine-tune epochs after pruning; the last one runs without augmentation")
+    parser.add_argument("--resolution", type=int, default=INPUT_SIZE, choices=range(32, INPUT_SIZE + 1, 16),
+                        help="Train and export at this input resolution; frames are downscaled when loaded")
+    parser.add_argument("--progressive-resize", action="store_true",
+                        help="Run the augmented epochs at resolutions growing from --progressive-min to --resolution")
+    parser.add_argument("--progressive-min", type=int, default=64,
+                        help="Resolution of the first epoch with --progressive-resize")
+    parser.add_argument("--resolutions", default="128,96,64",
+                        help="Resolutions compared by --compare-resolutions")
+    parser.add_argument("--compare-resolutions", action="store_true",
+                        help="Compare compute, latency and gaze error across --resolutions, then exit")
+    parser.add_argument("--benchmark-streaming", action="store_true",
+                        help="Compare frame-by-frame streaming inference with the 8-channel model, then exit")
+    parser.add_argument("--temporal-runs", type=int, default=0,
+                        help="Train on runs of N consecutive samples that decode and warp their shared frames once, "
+                             "with one augmentation draw per run (0 = off)")
+    parser.add_argument("--verify", action="store_true",
+                        help="Check the export against PyTorch and benchmark it in ONNX Runtime; exit with 1 on a mismatch")
+    parser.add_argument("--verify-only", action="store_true",
+                        help="Verify the existing --output against left_tuned.pth/right_tuned.pth without training, then exit")
+    parser.add_argument("--verify-frames", type=int, default=256,
+                        help="Aligned frames the export is compared on")
+    parser.add_argument("--parity-tolerance", type=float, default=1e-4,
+                        help="Largest absolute output difference between the export and PyTorch")
+    parser.add_argument("--verify-threads", default="",
+                        help="Comma-separated ONNX Runtime thread counts to benchmark (default: powers of two up to the physical cores)")
+    parser.add_argument("--verify-batches", default="8,32",
+                        help="Comma-separated batch sizes to measure throughput at")
+    parser.add_argument("--verify-runs", type=int, default=200,
+                        help="Timed batch-1 runs per thread count")
+    parser.add_argument("--verify-report", default="",
+                        help="Where to write the JSON report (default: <output>_verify.json)")
+    args = parser.parse_args(argv)
+    if args.loader is None:
+        args.loader = "threaded" if getattr(sys, "frozen", False) else "torch"
+    if args.loader != "threaded":
+        # The torch DataLoader loads in the training thread, there are no workers to size
+        if args.loader_workers is not None:
+            parser.error("--loader-workers only applies to --loader threaded")
+        if args.autotune_threads:
+            parser.error("--autotune-threads tunes the threaded loader's workers, use it with --loader threaded")
+    if args.loader_workers is not None and args.loader_workers < 1:
+        parser.error("--loader-workers must be at least 1")
+    if args.distributed and args.hard_examples:
+        # Loss-aware sampling reweights from per-sample losses that only the local rank sees
+        parser.error("--hard-examples is not supported with --distributed")
+    if args.sweep_freeze:
+        # Same range as --freeze-blocks
+        try:
+            args.sweep_freeze = [int(v) for v in args.sweep_freeze.split(',') if v.strip()]
+        except ValueError:
+            parser.error("--sweep-freeze expects comma separated integers, got '%s'" % args.sweep_freeze)
+        if not args.sweep_freeze or any(k not in range(0, 6) for k in args.sweep_freeze):
+            parser.error("--sweep-freeze values must be between 0 and 5")
+
+    # Checkpoints are only written by the standard schedule
+    uncheckpointed = [flag for flag, enabled in (("--time-budget", args.time_budget), ("--fast-calibration", args.fast_calibration),
+                                                 ("--freeze-blocks", args.freeze_blocks), ("--adapters", args.adapters)) if enabled]
+    if args.resume and uncheckpointed:
+        parser.error("--resume can't be used with %s, which doesn't write checkpoints" % uncheckpointed[0])
+    if args.checkpoint_every is not None and uncheckpointed:
+        parser.error("--checkpoint-every can't be used with %s, which doesn't write checkpoints" % uncheckpointed[0])
+    if args.temporal_runs > 1:
+        # The sampler orders runs, not samples: there are no per-frame losses to weight
+        # and no sample position to resume from within an epoch
+        if args.hard_examples:
+            parser.error("--hard-examples can't be used with --temporal-runs")
+        if args.checkpoint_every is not None and args.checkpoint_every > 0:
+            parser.error("--temporal-runs only checkpoints at epoch ends, use --checkpoint-every 0 or -1")
+    if args.checkpoint_every is None:
+        args.checkpoint_every = 0 if args.temporal_runs > 1 else 20
+
+    # The calibration modes replace each other, and only the schedules built on
+    # train_calibration (the standard one and --adapters) take its options
+    if len(uncheckpointed) > 1:
+        parser.error("%s can't be combined with %s" % (uncheckpointed[0], uncheckpointed[1]))
+    schedule_options = [flag for flag, enabled in (("--early-stopping", args.early_stopping), ("--hard-examples", args.hard_examples),
+                                                   ("--qat-epochs", args.qat_epochs), ("--temporal-runs", args.temporal_runs > 1),
+                                                   ("--progressive-resize", args.progressive_resize)) if enabled]
+    if schedule_options and uncheckpointed and uncheckpointed[0] != "--adapters":
+        parser.error("%s can't be used with %s" % (schedule_options[0], uncheckpointed[0]))
+    if args.adapters and args.qat_epochs:
+        # Fake quantization needs plain layers, the adapters wrap them
+        parser.error("--qat-epochs can't be used with --adapters")
+    return args
+
 def main():
-    global TRAINING
+    global RESOLUTION
+
+    args = parse_args()
+    RESOLUTION = args.resolution
+    deadline = time.time() + (args.time_budget or 0)
+
+    if args.benchmark_scaling:
+        benchmark_scaling(args)
+        return
+
+    if args.verify_only:
+        sys.exit(0 if verify_existing(args) else 1)
+
+    rank, world_size = init_distributed(args)
+    if world_size > 1:
+        # Ranks resume from epoch boundaries only, where every rank's shard follows from the epoch number
+        args.checkpoint_every = min(args.checkpoint_every, 0)
+        if args.time_budget:
+            # Each rank would turn the budget into its own step count and the all-reduce would stall
+            print("--time-budget is not supported in distributed training, using the epoch schedule", flush=True)
+            args.time_budget = 0
+
+    # Ranks sharing a host split its cores between them
+    local_ranks = int(os.environ.get("LOCAL_WORLD_SIZE", 1)) if world_size > 1 else 1
+    budget = ThreadBudget.from_spec(args.threads, cores=max(1, ThreadBudget.detect_physical_cores() // local_ranks),
+                                    threaded_loader=args.loader == "threaded")
+    if args.loader_workers is not None:
+        budget.loader_workers = args.loader_workers
+    budget.apply()
+    args.loader_workers = budget.loader_workers
+    print(budget.describe(), flush=True)
+    args.lr = scaled_lr(args.batch_size, args.lr_scaling)
 
     # Set random seed for reproducibility
     torch.manual_seed(42)
-    np.random.seed(42)
+    np.random.seed(42 + rank)
     
     model_L=MicroChad()
     model_R=MicroChad()
@@ -1308,88 +4787,146 @@ def main():
     print(model_L, flush=True)
     print(model_R, flush=True)
 
-    model_L.load_state_dict(torch.load("baseline_L.pth", map_location="cpu"))
+    if not args.from_scratch:
+        model_L.load_state_dict(torch.load("baseline_L.pth", map_location="cpu"))
+        model_R.load_state_dict(torch.load("baseline_R.pth", map_location="cpu"))
     model_L.to(DEVICE)
-    model_R.load_state_dict(torch.load("baseline_R.pth", map_location="cpu"))
     model_R.to(DEVICE)
     trained_model_L = model_L
     trained_model_R = model_R
 
-    EPOCHS_AUG = 8 # 8
-    EPOCHS_NOAUG = 1
-
-    if True:
-        for e in range(1):
-            dataset = CaptureDataset('user_cal.bin', all_frames=False, side='left')
-
-            train_dataset = dataset
-            train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True, num_workers=0)
-
-            trained_model_L, epoch_losses, batch_losses = train_model(
-                trained_model_L,
-                None,
-                train_loader, 
-                num_epochs=EPOCHS_AUG,
-                lr=0.001,
-                class_step=True, 
-                e_add = 0,
-                e_total = EPOCHS_AUG+EPOCHS_AUG+EPOCHS_NOAUG+EPOCHS_NOAUG
-            )
-
-            TRAINING = False # disable augs for 1 epoch
-
-            del train_loader
-
-            train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True, num_workers=0)
-
-            trained_model_L, epoch_losses, batch_losses = train_model(
-                trained_model_L, 
-                None,
-                train_loader, 
-                num_epochs=EPOCHS_NOAUG,
-                lr=0.001,
-                class_step=True,
-                e_add = EPOCHS_AUG,
-                e_total = EPOCHS_AUG+EPOCHS_AUG+EPOCHS_NOAUG+EPOCHS_NOAUG
-            )
-        
-        TRAINING = True
-
-        for e in range(1):
-            dataset = CaptureDataset('user_cal.bin', all_frames=False, side='right')
-
-            train_dataset = dataset
-            train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True, num_workers=0)
-
-            trained_model_R, epoch_losses, batch_losses = train_model(
-                trained_model_R,
-                None,
-                train_loader, 
-                num_epochs=EPOCHS_AUG,
-                lr=0.001,
-                class_step=True,
-                e_add = EPOCHS_AUG+EPOCHS_NOAUG,
-                e_total = EPOCHS_AUG+EPOCHS_AUG+EPOCHS_NOAUG+EPOCHS_NOAUG
-            )
-
-            TRAINING = False # disable augs for 1 epoch
-
-            del train_loader
+    if args.scaling_probe:
+        scaling_probe(args)
+        if world_size > 1:
+            dist.destroy_process_group()
+        return
+
+    if args.compare_precision:
+        compare_precision(args)
+        return
+
+    if args.benchmark_export:
+        benchmark_fused_export(args)
+        return
+
+    if args.benchmark_streaming:
+        benchmark_streaming(args)
+        return
+
+    if args.compare_qat:
+        compare_qat(args)
+        return
+
+    if args.compare_widths:
+        compare_widths(args)
+        return
+
+    if args.compare_resolutions:
+        compare_resolutions(args)
+        return
+
+    if args.benchmark_compile:
+        benchmark_execution_modes(args)
+        return
+
+    if args.compare_fast_calibration:
+        compare_fast_calibration(args)
+        return
+
+    if args.sweep_freeze:
+        sweep_frozen_blocks(args)
+        return
+
+    if args.compare_samplers:
+        compare_samplers(args)
+        return
+
+    if args.compare_coreset:
+        if not 0 < args.coreset < 1:
+            args.coreset = 0.5
+        compare_coreset(args)
+        return
+
+    resume = None
+    if args.resume:
+        resume = CheckpointWriter.load(args.checkpoint)
+        if resume is not None and resume['context']['joint'] != args.joint:
+            print("Checkpoint was written %s --joint, starting from scratch" % ("with" if resume['context']['joint'] else "without"), flush=True)
+            resume = None
+    completed = resume['context']['completed'] if resume is not None else {}
+
+    # Only the standard schedule is checkpointed; parse_args rejects --resume with the other modes
+    checkpointer = None
+    if rank == 0 and args.checkpoint_every >= 0 and not (args.time_budget or args.fast_calibration or args.freeze_blocks or args.adapters):
+        checkpointer = CheckpointWriter(args.checkpoint, joint=args.joint, completed=completed)
+
+    if args.joint:
+        # Both eyes in one pass: the capture is decoded and aligned once and every
+        # batch drives both towers, instead of two full sequential trainings
+        multi = MultiChad()
+        multi.left = trained_model_L
+        multi.right = trained_model_R
+
+        if 'both' in completed:
+            load_training_state(multi, completed['both'])
+        else:
+            dataset = load_capture_dataset(args.capture, 'both', args.corpus)
+            if args.autotune_threads:
+                budget = autotune_thread_budget(budget, dataset, multi, args)
+                print(budget.describe(), flush=True)
+            if args.autotune_batch:
+                autotune_batch_size(dataset, multi, args)
+
+            multi = calibrate(multi, dataset, args, 'both', budget_s=deadline - time.time(),
+                              e_add=0, e_total=EPOCHS_AUG+EPOCHS_NOAUG, checkpointer=checkpointer, resume=resume)
+
+        trained_model_L = multi.left
+        trained_model_R = multi.right
+    else:
+        e_total = EPOCHS_AUG+EPOCHS_AUG+EPOCHS_NOAUG+EPOCHS_NOAUG
 
-            train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True, num_workers=0)
+        load_time = 0.0
+        if 'left' in completed:
+            load_training_state(trained_model_L, completed['left'])
+        else:
+            load_start = time.time()
+            dataset = load_capture_dataset(args.capture, 'left', args.corpus)
+            load_time = time.time() - load_start
+            if args.autotune_threads:
+                budget = autotune_thread_budget(budget, dataset, trained_model_L, args)
+                print(budget.describe(), flush=True)
+            if args.autotune_batch:
+                autotune_batch_size(dataset, trained_model_L, args)
+
+            # With a time budget, split what is left evenly, keeping back the time the right eye's dataset will take to load
+            trained_model_L = calibrate(trained_model_L, dataset, args, 'left', budget_s=(deadline - time.time() - load_time) / 2,
+                                        e_add=0, e_total=e_total, checkpointer=checkpointer, resume=resume)
+
+        if 'right' in completed:
+            load_training_state(trained_model_R, completed['right'])
+        else:
+            dataset = load_capture_dataset(args.capture, 'right', args.corpus)
+            if args.autotune_batch:
+                # Normally a cache hit from the left eye; probes when resuming with the left eye done
+                autotune_batch_size(dataset, trained_model_R, args)
+            trained_model_R = calibrate(trained_model_R, dataset, args, 'right', budget_s=deadline - time.time(),
+                                        e_add=EPOCHS_AUG+EPOCHS_NOAUG, e_total=e_total, checkpointer=checkpointer, resume=resume)
+
+    if world_size > 1:
+        # Every rank holds the same weights; only rank 0 writes them out
+        dist.destroy_process_group()
+        if rank != 0:
+            return
 
-            trained_model_R, epoch_losses, batch_losses = train_model(
-                trained_model_R, 
-                None,
-                train_loader, 
-                num_epochs=EPOCHS_NOAUG,
-                lr=0.001,
-                class_step=True,
-                e_add = EPOCHS_AUG+EPOCHS_AUG+EPOCHS_NOAUG,
-                e_total = EPOCHS_AUG+EPOCHS_AUG+EPOCHS_NOAUG+EPOCHS_NOAUG
-            )
+    qat_multi = None
+    if is_fake_quantized(trained_model_L) or is_fake_quantized(trained_model_R):
+        # The fake-quantized towers give the INT8 export; saved weights and the fp32 export use plain layers
+        qat_multi = MultiChad()
+        qat_multi.left = trained_model_L
+        qat_multi.right = trained_model_R
+        trained_model_L = remove_fake_quant(copy.deepcopy(trained_model_L))
+        trained_model_R = remove_fake_quant(copy.deepcopy(trained_model_R))
 
-            
     # Save the final model
     #torch.save(trained_model.state_dict(), "final_model_temporal_que_tuned_2.pth")
     
@@ -1403,24 +4940,37 @@ def main():
 
     print("\nTraining completed successfully!\n", flush=True)
 
-    device = torch.device("cpu")
-    
-    dummy_input = torch.randn(1, 8, 128, 128, device=device)  # Updated to 8 channels
-    torch.onnx.export(
-        multi,
-        dummy_input,
-        sys.argv[2],
-        export_params=True,
-        opset_version=15,
-        do_constant_folding=True,
-        input_names=['input'],
-        output_names=['output'],
-        dynamic_axes={
-            'input': {0: 'batch_size'},
-            'output': {0: 'batch_size'}
-        }
-    )
-    print("Model exported to ONNX: " + sys.argv[2], flush=True)
+    exported = fuse_for_export(multi, args.export_fused) if args.export_fused != "off" else multi
+    export_onnx(exported, args.output)
+    print("Model exported to ONNX: " + args.output, flush=True)
+
+    if args.export_variants or args.int8 or qat_multi is not None or args.distill_width or args.prune or args.verify:
+        # Decoded once for every step below; joint training already has it
+        if not args.joint or 'both' in completed:
+            dataset = load_capture_dataset(args.capture, 'both', args.corpus)
+
+    if args.export_variants:
+        export_variants(multi, exported, dataset, args)
+
+    if args.int8:
+        quantize_int8(dataset, args)
+
+    if qat_multi is not None:
+        export_qat_int8(qat_multi, dataset, args)
+
+    if args.distill_width:
+        export_slim(multi, dataset, args)
+
+    if args.prune:
+        export_pruned(multi, dataset, args)
+
+    if checkpointer is not None:
+        # Finished cleanly, nothing left to resume
+        checkpointer.close(remove=True)
+
+    if args.verify and not verify_onnx(multi, args.output, dataset, args):
+        print("ONNX export doesn't match the trained model", flush=True)
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()